@@ -1,14 +1,20 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from models import get_db, Student
+from sqlalchemy import select
+from models import AsyncSessionLocal, Student
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
 import jwt
 import os
+import time
+import threading
 from datetime import datetime
 
 # Environment variables
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
 JWT_ALGORITHM = "HS256"
+STUDENT_CACHE_TTL_SECONDS = float(os.getenv("STUDENT_CACHE_TTL_SECONDS", "30"))
+STUDENT_CACHE_MAX_ENTRIES = int(os.getenv("STUDENT_CACHE_MAX_ENTRIES", "10000"))
 
 security = HTTPBearer()
 
@@ -26,29 +32,96 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token has expired"
         )
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
         )
 
-def get_current_student(
-    token_payload: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
-) -> Student:
-    """Get current authenticated student"""
-    student_id = token_payload.get("sub")
-    if not student_id:
+@dataclass(frozen=True)
+class StudentPrincipal:
+    """Authenticated student identity taken from verified token claims"""
+    id: int
+    email: Optional[str] = None
+
+class StudentCache:
+    """Short-lived, bounded cache of authenticated students keyed by id"""
+
+    def __init__(self, ttl: float = STUDENT_CACHE_TTL_SECONDS, max_entries: int = STUDENT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[int, Tuple[float, StudentPrincipal]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, student_id: int) -> Optional[StudentPrincipal]:
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[student_id]
+            self.misses += 1
+            return None
+
+    def put(self, principal: StudentPrincipal):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries and principal.id not in self._entries:
+                # Dicts keep insertion order, so this evicts the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+
+    def invalidate(self, student_id: int):
+        """Drop a student's cached entry; call after changing or deleting the account"""
+        with self._lock:
+            self._entries.pop(student_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+student_cache = StudentCache()
+
+async def get_current_principal(token_payload: dict = Depends(verify_token)) -> StudentPrincipal:
+    """Resolve the caller from the token and check the account still exists.
+
+    The lookup is cached for STUDENT_CACHE_TTL_SECONDS, so most requests make
+    no database round-trip; a deleted account stops authenticating once its
+    entry expires or is invalidated.
+    """
+    try:
+        student_id = int(token_payload.get("sub"))
+    except (TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token payload"
         )
+    principal = student_cache.get(student_id)
+    if principal is not None:
+        return principal
     
-    student = db.query(Student).filter(Student.id == int(student_id)).first()
-    if not student:
+    # Primary, not a replica: a student who just registered may not have replicated yet
+    async with AsyncSessionLocal() as db:
+        email = await db.scalar(select(Student.email).where(Student.id == student_id))
+    if email is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Student not found"
         )
-    
-    return student
+    principal = StudentPrincipal(id=student_id, email=email)
+    student_cache.put(principal)
+    return principal
@@ -0,0 +1,140 @@
+"""
+Response compression (brotli/gzip) for large JSON bodies
+"""
+
+import os
+import gzip
+from typing import Optional, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Brotli is optional; without it only gzip is offered
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Environment variables
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain", "text/css", "application/javascript")
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best content coding the client accepts (brotli over gzip)"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def weak_etag(etag: str) -> str:
+    """ETag of a compressed representation.
+
+    Compressed bytes differ from the identity body, so they must not share its
+    strong ETag; a weak one still matches If-None-Match under weak comparison.
+    """
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+def merge_vary(values: List[str], field: str = "Accept-Encoding") -> str:
+    """Combine Vary header values and add ``field`` unless already covered"""
+    fields = [name.strip() for value in values for name in value.split(",") if name.strip()]
+    if "*" not in fields and field.lower() not in (name.lower() for name in fields):
+        fields.append(field)
+    return ", ".join(fields)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete responses above COMPRESSION_MIN_SIZE.
+
+    Streaming responses (Server-Sent Events, file downloads sent in chunks)
+    and responses that already carry a Content-Encoding pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                response_headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in response_headers or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Hold the headers until the body shows whether it is worth compressing
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            if start_message is not None:
+                body = message.get("body", b"")
+                held, start_message = start_message, None
+                if message.get("more_body") or len(body) < self.minimum_size:
+                    # Streaming or small: send as-is
+                    passthrough = True
+                    await send(held)
+                    await send(message)
+                    return
+                compressed = compress(body, encoding)
+                response_headers = []
+                vary = []
+                for key, value in held.get("headers", []):
+                    name = key.lower()
+                    if name == b"vary":
+                        vary.append(value.decode("latin-1"))
+                    elif name == b"etag":
+                        response_headers.append((key, weak_etag(value.decode("latin-1")).encode("latin-1")))
+                    elif name != b"content-length":
+                        response_headers.append((key, value))
+                response_headers += [
+                    (b"content-encoding", encoding.encode()),
+                    (b"content-length", str(len(compressed)).encode()),
+                    (b"vary", merge_vary(vary).encode("latin-1")),
+                ]
+                await send({**held, "headers": response_headers})
+                await send({"type": "http.response.body", "body": compressed})
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
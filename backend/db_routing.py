@@ -0,0 +1,83 @@
+"""
+Read/write routing between the primary database and read replicas
+"""
+
+import os
+import time
+import itertools
+import threading
+from typing import Dict, Any, Optional, Tuple
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from models import AsyncSessionLocal, ReplicaSessionLocals
+
+# Environment variables
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+
+# Pruning kicks in once this many recent writes are tracked
+_GUARD_PRUNE_THRESHOLD = 10000
+
+
+class ReadYourWritesGuard:
+    """Remembers recent writes so that follow-up reads are served by the primary.
+
+    Keys are ("student", id) for uploads and ("assignment", id) for completed
+    analyses; a read touching either within the window skips the replicas,
+    which may not have replayed the write yet.
+    """
+
+    def __init__(self, window: float = READ_YOUR_WRITES_SECONDS):
+        self.window = window
+        self._writes: Dict[Tuple[str, int], float] = {}
+        self._lock = threading.Lock()
+
+    def mark(self, student_id: Optional[int] = None, assignment_id: Optional[int] = None):
+        expires = time.monotonic() + self.window
+        with self._lock:
+            if student_id is not None:
+                self._writes[("student", student_id)] = expires
+            if assignment_id is not None:
+                self._writes[("assignment", assignment_id)] = expires
+            if len(self._writes) > _GUARD_PRUNE_THRESHOLD:
+                now = time.monotonic()
+                self._writes = {key: until for key, until in self._writes.items() if until > now}
+
+    def recent(self, student_id: Optional[int] = None, assignment_id: Optional[int] = None) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return any(
+                self._writes.get(key, 0) > now
+                for key in (("student", student_id), ("assignment", assignment_id))
+                if key[1] is not None
+            )
+
+
+class ReadRouter:
+    """Chooses the session factory for a read: round-robin replicas, or the primary"""
+
+    def __init__(self, replicas=ReplicaSessionLocals):
+        self.replicas = list(replicas)
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+        self.replica_reads = 0
+
+    def sessionmaker(self, student_id: Optional[int] = None, assignment_id: Optional[int] = None) -> async_sessionmaker:
+        with self._lock:
+            if self._cycle is None or read_guard.recent(student_id, assignment_id):
+                self.primary_reads += 1
+                return AsyncSessionLocal
+            self.replica_reads += 1
+            return next(self._cycle)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replicas": len(self.replicas),
+                "primary_reads": self.primary_reads,
+                "replica_reads": self.replica_reads,
+            }
+
+
+read_guard = ReadYourWritesGuard()
+read_router = ReadRouter()
+
@@ -0,0 +1,117 @@
+"""
+Reuse of analysis results for byte-identical submissions
+"""
+
+from typing import Optional, Dict, Any
+from sqlalchemy import func, select
+from sqlalchemy.orm import undefer
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Assignment, AnalysisResult
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DedupStats:
+    """Process-local counters for analysis reuse"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "analysis_reuse_hits": self.hits,
+                "analysis_reuse_misses": self.misses,
+                "analysis_reuse_hit_rate": self.hits / total if total else 0.0
+            }
+
+
+dedup_stats = DedupStats()
+
+
+async def find_analyzed_duplicate(db: AsyncSession, file_hash: str, exclude_id: int) -> Optional[Assignment]:
+    """Return an earlier assignment with the same content that has already been analyzed"""
+    if not file_hash:
+        return None
+
+    return await db.scalar(
+        select(Assignment).options(undefer(Assignment.original_text)).join(
+            AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+        ).where(
+            Assignment.file_hash == file_hash,
+            Assignment.id != exclude_id
+        ).order_by(Assignment.id.desc()).limit(1)
+    )
+
+
+async def clone_analysis(db: AsyncSession, source: Assignment, target: Assignment) -> AnalysisResult:
+    """Copy the extracted fields and analysis result of ``source`` onto ``target``.
+
+    The caller is responsible for committing the session.
+    """
+    result = await db.scalar(
+        select(AnalysisResult).where(
+            AnalysisResult.assignment_id == source.id
+        ).order_by(AnalysisResult.id.desc()).limit(1)
+    )
+
+    target.original_text = source.original_text
+    target.topic = source.topic
+    target.academic_level = source.academic_level
+    target.word_count = source.word_count
+
+    clone = AnalysisResult(
+        assignment_id=target.id,
+        suggested_sources=result.suggested_sources,
+        plagiarism_score=result.plagiarism_score,
+        flagged_sections=result.flagged_sections,
+        research_suggestions=result.research_suggestions,
+        citation_recommendations=result.citation_recommendations,
+        confidence_score=result.confidence_score,
+        # No pipeline run happened, so there are no timings to report
+        run_stats={"reused_from_result_id": result.id}
+    )
+    db.add(clone)
+
+    logger.info(f"Reused analysis of assignment {source.id} for duplicate assignment {target.id}")
+    return clone
+
+
+async def reuse_existing_analysis(db: AsyncSession, assignment: Assignment) -> bool:
+    """Clone a prior analysis onto ``assignment`` if identical content was already analyzed (uncommitted)"""
+    duplicate = await find_analyzed_duplicate(db, assignment.file_hash, assignment.id)
+    dedup_stats.record(duplicate is not None)
+    if duplicate is None:
+        return False
+
+    await clone_analysis(db, duplicate, assignment)
+    return True
+
+
+async def storage_stats(db: AsyncSession) -> Dict[str, Any]:
+    """Upload-level deduplication figures computed from the assignments table"""
+    total, unique = (await db.execute(
+        select(
+            func.count(Assignment.file_hash),
+            func.count(func.distinct(Assignment.file_hash))
+        )
+    )).one()
+    duplicates = total - unique
+    return {
+        "hashed_uploads": total,
+        "unique_contents": unique,
+        "duplicate_uploads": duplicates,
+        "storage_hit_rate": duplicates / total if total else 0.0
+    }
@@ -0,0 +1,130 @@
+"""
+In-process publish/subscribe for analysis progress events
+"""
+
+import json
+import asyncio
+from typing import Dict, Set, Any, Optional, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prefix of progress lines written to stdout by process_assignment.py
+PROGRESS_MARKER = "@@progress "
+# Prefix of the metrics line the child writes once before exiting
+METRICS_MARKER = "@@metrics "
+
+# Events that end an assignment's analysis
+TERMINAL_EVENTS = {"completed", "failed"}
+
+
+def assignment_topic(assignment_id: int) -> str:
+    return f"assignment:{assignment_id}"
+
+
+def batch_topic(batch_id: str) -> str:
+    return f"batch:{batch_id}"
+
+
+class SubscriberQueue(asyncio.Queue):
+    """Bounded event queue that always makes room for terminal events.
+
+    When full, a progress event is dropped, while a terminal event evicts the
+    oldest queued progress event. If only terminal events are queued the
+    newcomer is dropped too and ``overflowed`` is set, telling the reader to
+    resynchronise from the database.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Queue an event without blocking; returns False if it was dropped"""
+        if self.full():
+            if event["event"] not in TERMINAL_EVENTS:
+                return False
+            evictable = next((queued for queued in self._queue if queued["event"] not in TERMINAL_EVENTS), None)
+            if evictable is None:
+                self.overflowed = True
+                return False
+            self._queue.remove(evictable)
+        self.put_nowait(event)
+        return True
+
+
+class EventBroker:
+    """Fan events out to the subscribers of a topic.
+
+    Each subscriber owns a bounded queue; a subscriber that stops reading
+    loses intermediate progress events instead of growing memory without
+    limit, but keeps the terminal ones (see ``SubscriberQueue``).
+    """
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._subscribers: Dict[str, Set[SubscriberQueue]] = {}
+
+    def subscribe(self, topic: str) -> SubscriberQueue:
+        queue = SubscriberQueue(self.max_pending)
+        self._subscribers.setdefault(topic, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: SubscriberQueue):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[topic]
+
+    def publish(self, topic: str, event: Dict[str, Any]):
+        for queue in self._subscribers.get(topic, ()):
+            if not queue.offer(event):
+                logger.warning(f"Dropping {event['event']} event for slow subscriber on {topic}")
+
+    def publish_assignment_event(self, assignment_id: int, event: str,
+                                 batch_id: Optional[str] = None, **data):
+        """Publish an event to the assignment topic and, if any, its batch topic"""
+        payload = {"assignment_id": assignment_id, "event": event, **data}
+        self.publish(assignment_topic(assignment_id), payload)
+        if batch_id:
+            self.publish(batch_topic(batch_id), {**payload, "batch_id": batch_id})
+
+
+def report_progress(stage: str, **data):
+    """Emit a progress line from the analysis child process"""
+    print(PROGRESS_MARKER + json.dumps({"event": stage, **data}), flush=True)
+
+
+def parse_progress(line: str) -> Optional[Dict[str, Any]]:
+    """Decode a progress line written by ``report_progress``"""
+    if not line.startswith(PROGRESS_MARKER):
+        return None
+    try:
+        return json.loads(line[len(PROGRESS_MARKER):])
+    except ValueError:
+        return None
+
+
+def report_metrics(observations: List[list]):
+    """Hand metric observations from the analysis child to the API process"""
+    print(METRICS_MARKER + json.dumps(observations), flush=True)
+
+
+def parse_metrics(line: str) -> Optional[List[list]]:
+    """Decode a metrics line written by ``report_metrics``"""
+    if not line.startswith(METRICS_MARKER):
+        return None
+    try:
+        return json.loads(line[len(METRICS_MARKER):])
+    except ValueError:
+        return None
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Serialize an event as a Server-Sent Events message"""
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+broker = EventBroker()
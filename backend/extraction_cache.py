@@ -0,0 +1,73 @@
+"""
+Compressed on-disk cache of cleaned document text keyed by file content hash
+"""
+
+import os
+import gzip
+import uuid
+import hashlib
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+EXTRACTION_CACHE_DIR = os.getenv(
+    "EXTRACTION_CACHE_DIR",
+    os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "extracted")
+)
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+
+# Bump whenever extraction or cleaning output changes so stale entries are ignored
+EXTRACTOR_VERSION = "1"
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_path(file_hash: str, variant: str = "") -> str:
+    return os.path.join(EXTRACTION_CACHE_DIR, file_hash[:2], f"{file_hash}.v{EXTRACTOR_VERSION}{variant}.txt.gz")
+
+
+def get_cached_text(file_hash: str, variant: str = "") -> Optional[str]:
+    """Return the cached cleaned text for a file hash, or None on a miss.
+
+    ``variant`` tells apart extractions of the same bytes under different
+    settings, such as page or text size limits that truncate the document.
+    """
+    if not EXTRACTION_CACHE_ENABLED or not file_hash:
+        return None
+    path = _cache_path(file_hash, variant)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as cached:
+            return cached.read()
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        # Corrupt or truncated entry; drop it and extract again
+        logger.warning(f"Discarding unreadable extraction cache entry {path}: {e}")
+        os.remove(path)
+        return None
+
+
+def put_cached_text(file_hash: str, text: str, variant: str = ""):
+    """Store cleaned text for a file hash, replacing any existing entry atomically"""
+    if not EXTRACTION_CACHE_ENABLED or not file_hash:
+        return
+    path = _cache_path(file_hash, variant)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with gzip.open(partial_path, "wt", encoding="utf-8", compresslevel=6) as cached:
+            cached.write(text)
+        os.replace(partial_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write extraction cache entry {path}: {e}")
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
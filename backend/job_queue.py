@@ -0,0 +1,381 @@
+"""
+In-process worker pool for assignment analysis
+"""
+
+import os
+import sys
+import signal
+import math
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
+from sqlalchemy import select, update, exists, or_
+from models import AsyncSessionLocal, Assignment, AnalysisResult
+from events import broker, parse_progress, parse_metrics, TERMINAL_EVENTS
+import metrics
+from scheduler import FairScheduler, Job, PRIORITY_CLASSES
+from db_routing import read_guard
+from profiling import PROFILE_JOB_ENV
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "4"))
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "200"))
+MAX_ESTIMATED_WAIT_SECONDS = float(os.getenv("MAX_ESTIMATED_WAIT_SECONDS", "600"))
+ADMISSION_MODE = os.getenv("ADMISSION_MODE", "reject")  # 'reject' (429) or 'defer'
+# Assumed job duration until real completions have been observed
+DEFAULT_JOB_SECONDS = float(os.getenv("DEFAULT_JOB_SECONDS", "30"))
+# Analysis children running longer are killed and the analysis marked failed; 0 = no limit
+ANALYSIS_JOB_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_JOB_TIMEOUT_SECONDS", "600"))
+# Re-queue analyses lost with a previous process at startup
+ANALYSIS_RECOVERY_ENABLED = os.getenv("ANALYSIS_RECOVERY_ENABLED", "false").lower() == "true"
+# Only uploads this recent are recovered, so old unanalyzed rows are left alone
+ANALYSIS_RECOVERY_MAX_AGE_HOURS = float(os.getenv("ANALYSIS_RECOVERY_MAX_AGE_HOURS", "24"))
+DRAIN_WINDOW_SECONDS = 300
+# Longest error message kept on a failed assignment
+MAX_ERROR_LENGTH = 2000
+# Slack on top of the job timeout before a claim is taken to belong to a dead process
+CLAIM_GRACE_SECONDS = 60
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class AdmissionDecision:
+    """Outcome of an admission check against the current queue load"""
+    admitted: bool
+    queue_depth: int
+    estimated_wait: float
+    retry_after: int = 0
+
+
+async def record_failure(assignment_id: int, error: Optional[str]):
+    """Persist a failed analysis so late subscribers and status reads see it"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(Assignment).where(Assignment.id == assignment_id).values(
+                    analysis_failed_at=datetime.utcnow(),
+                    analysis_error=(error or "Analysis failed")[:MAX_ERROR_LENGTH]
+                )
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Could not record failure of assignment {assignment_id}: {str(e)}")
+
+
+def _claimable(now: datetime):
+    """Assignments no live worker is analyzing"""
+    unclaimed = Assignment.analysis_claimed_at.is_(None)
+    if not ANALYSIS_JOB_TIMEOUT_SECONDS:
+        return unclaimed
+    # Any live worker has killed its child by then, so the claim was left by a process that died
+    expired = now - timedelta(seconds=ANALYSIS_JOB_TIMEOUT_SECONDS + CLAIM_GRACE_SECONDS)
+    return or_(unclaimed, Assignment.analysis_claimed_at < expired)
+
+
+async def claim(assignment_id: int) -> bool:
+    """Atomically mark an analysis as started by this process.
+
+    False when it already has a result, has failed, or is running in another
+    process, e.g. one that queued it before a restart re-queued it here.
+    """
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(Assignment).where(
+                Assignment.id == assignment_id,
+                Assignment.analysis_failed_at.is_(None),
+                _claimable(now),
+                ~exists().where(AnalysisResult.assignment_id == Assignment.id)
+            ).values(analysis_claimed_at=now).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    return result.rowcount == 1
+
+
+def _kill(process: asyncio.subprocess.Process):
+    """Kill an analysis child together with its extraction pool workers"""
+    try:
+        if hasattr(os, "killpg"):
+            # The child leads its own process group (start_new_session)
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+
+class AnalysisQueue:
+    """Fan analysis jobs out to a fixed number of worker tasks.
+
+    Each job runs ``process_assignment.py`` as a child process, so extraction
+    and LLM calls never block the API event loop. Jobs are handed out in the
+    order chosen by ``FairScheduler``.
+    """
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS,
+                 max_depth: int = MAX_QUEUE_DEPTH,
+                 max_wait: float = MAX_ESTIMATED_WAIT_SECONDS,
+                 mode: str = ADMISSION_MODE):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_wait = max_wait
+        self.mode = mode
+        self._queue: Optional[FairScheduler] = None
+        # Jobs held back by admission control, released in the same fair order as the run queue
+        self._deferred: Optional[FairScheduler] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._completions = deque()  # monotonic completion times within DRAIN_WINDOW_SECONDS
+        self._avg_job_seconds = DEFAULT_JOB_SECONDS
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        if self._tasks:
+            return
+        self._queue = FairScheduler()
+        self._deferred = FairScheduler()
+        self._tasks = [
+            asyncio.create_task(self._worker(n)) for n in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} analysis workers")
+
+    async def stop(self):
+        """Cancel the worker tasks"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, assignment_id: int, batch_id: Optional[str] = None,
+               owner=None, cost: int = 0, priority: str = "interactive",
+               profile: bool = False) -> bool:
+        """Queue an assignment for analysis.
+
+        ``owner`` is the fairness key (the student), ``cost`` the estimated job
+        size (file size) and ``priority`` either ``interactive`` or ``bulk``.
+        ``profile`` stores a profile of the analysis whatever its duration.
+        In ``defer`` mode, work submitted while the queue is overloaded is held
+        back and released as the backlog drains. Returns False if deferred.
+        """
+        if self._queue is None:
+            self.start()
+        job = Job(assignment_id, batch_id, owner=owner, cost=cost or 0, priority=priority, profile=profile)
+        if self.mode == "defer" and not self.admission(priority).admitted:
+            self._deferred.put(job)
+            broker.publish_assignment_event(assignment_id, "deferred", batch_id)
+            return False
+        self._enqueue(job)
+        return True
+
+    def _enqueue(self, job: Job):
+        job.enqueued_at = time.monotonic()
+        self._queue.put(job)
+        broker.publish_assignment_event(job.assignment_id, "queued", job.batch_id)
+
+    async def _release_deferred(self):
+        """Move held-back jobs to the run queue while their class is admitted"""
+        while self._deferred.qsize():
+            waiting = [name for name in PRIORITY_CLASSES if self._deferred.qsize(name)]
+            admitted = [name for name in waiting if self.admission(name).admitted]
+            if not admitted:
+                return
+            # With every waiting class admitted the scheduler's weights pick; otherwise take the admitted one
+            self._enqueue(await self._deferred.get(None if admitted == waiting else admitted[0]))
+
+    async def recover(self) -> int:
+        """Queue analyses lost with a previous process.
+
+        Recent assignments with no result, no recorded failure and no live
+        claim were queued or deferred in a process that stopped, or were
+        running when it died. Another process may still hold some of them in
+        memory; whichever claims one first runs it. Returns the number queued.
+        """
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(Assignment.id, Assignment.batch_id, Assignment.student_id, Assignment.file_size)
+                .outerjoin(AnalysisResult, AnalysisResult.assignment_id == Assignment.id)
+                .where(
+                    AnalysisResult.id.is_(None),
+                    Assignment.analysis_failed_at.is_(None),
+                    Assignment.uploaded_at >= now - timedelta(hours=ANALYSIS_RECOVERY_MAX_AGE_HOURS),
+                    _claimable(now)
+                )
+                .order_by(Assignment.id)
+            )).all()
+        for assignment_id, batch_id, student_id, file_size in rows:
+            self.submit(
+                assignment_id, batch_id, owner=student_id, cost=file_size or 0,
+                priority="bulk" if batch_id else "interactive"
+            )
+        if rows:
+            logger.info(f"Re-queued {len(rows)} unfinished analyses")
+        return len(rows)
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def class_depth(self, priority: str) -> int:
+        """Number of jobs of one priority class waiting for a worker"""
+        if self._queue is None:
+            return 0
+        return self._queue.qsize(priority)
+
+    def drain_rate(self) -> float:
+        """Completed jobs per second over the recent window"""
+        now = time.monotonic()
+        while self._completions and now - self._completions[0] > DRAIN_WINDOW_SECONDS:
+            self._completions.popleft()
+        if len(self._completions) < 2:
+            return 0.0
+        return len(self._completions) / max(now - self._completions[0], 1.0)
+
+    def estimated_wait(self, depth: Optional[int] = None) -> float:
+        """Seconds a job queued behind ``depth`` others is expected to wait for a worker"""
+        depth = self.depth if depth is None else depth
+        rate = self.drain_rate()
+        if rate > 0:
+            return depth / rate
+        return depth * self._avg_job_seconds / self.workers
+
+    def admission(self, priority: str = "bulk") -> AdmissionDecision:
+        """Check whether new work fits under the depth and wait thresholds.
+
+        Interactive work is only measured against the interactive backlog,
+        since the scheduler serves it ahead of queued bulk batches.
+        """
+        depth = self.class_depth("interactive") if priority == "interactive" else self.depth
+        wait = self.estimated_wait(depth)
+        if depth < self.max_depth and wait < self.max_wait:
+            return AdmissionDecision(True, depth, wait)
+
+        # Time until the backlog is back under both thresholds
+        rate = self.drain_rate() or self.workers / self._avg_job_seconds
+        excess = max(depth - self.max_depth + 1, (wait - self.max_wait) * rate, 1)
+        return AdmissionDecision(False, depth, wait, retry_after=math.ceil(excess / rate))
+
+    def status(self) -> Dict[str, Any]:
+        """Current load figures for monitoring"""
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queue_depth": self.depth,
+            "deferred": self._deferred.qsize() if self._deferred is not None else 0,
+            "drain_rate_per_second": round(self.drain_rate(), 4),
+            "estimated_wait_seconds": round(self.estimated_wait(), 1),
+            "average_job_seconds": round(self._avg_job_seconds, 1),
+            "max_queue_depth": self.max_depth,
+            "max_estimated_wait_seconds": self.max_wait,
+            "admission_mode": self.mode,
+            "classes": self._queue.stats() if self._queue is not None else {}
+        }
+
+    async def _worker(self, number: int):
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            started = time.monotonic()
+            outcome = "failed"
+            try:
+                outcome = await self._run(job.assignment_id, job.batch_id, job.owner, job.profile)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to process assignment {job.assignment_id}: {str(e)}")
+                await record_failure(job.assignment_id, str(e))
+                broker.publish_assignment_event(job.assignment_id, "failed", job.batch_id, error=str(e))
+            finally:
+                self._running -= 1
+                finished = time.monotonic()
+                self._completions.append(finished)
+                if outcome != "skipped":
+                    metrics.analysis_job_duration.labels(outcome).observe(finished - started)
+                    # Exponentially weighted so the estimate follows recent job sizes
+                    self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * (finished - started)
+                await self._release_deferred()
+
+    async def _run(self, assignment_id: int, batch_id: Optional[str], owner=None,
+                   profile: bool = False) -> str:
+        """Run one analysis in a child process; returns the terminal event, or "skipped" """
+        if not await claim(assignment_id):
+            logger.info(f"Skipping assignment {assignment_id}: already analyzed, failed or running elsewhere")
+            return "skipped"
+        broker.publish_assignment_event(assignment_id, "started", batch_id)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "process_assignment.py", str(assignment_id),
+            cwd=BACKEND_DIR,
+            env={**os.environ, PROFILE_JOB_ENV: "1"} if profile else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+
+        outcome = None
+
+        async def relay_progress():
+            # Forward stage events from the child as they are written
+            nonlocal outcome
+            async for raw_line in process.stdout:
+                line = raw_line.decode(errors="replace")
+                observations = parse_metrics(line)
+                if observations is not None:
+                    metrics.replay(observations)
+                    continue
+                event = parse_progress(line)
+                if event is None:
+                    continue
+                stage = event.pop("event")
+                if stage in TERMINAL_EVENTS:
+                    # Before clients hear about it, so their next read goes to the primary
+                    read_guard.mark(student_id=owner, assignment_id=assignment_id)
+                    outcome = stage
+                    if stage == "failed":
+                        await record_failure(assignment_id, event.get("error"))
+                broker.publish_assignment_event(assignment_id, stage, batch_id, **event)
+
+        async def communicate() -> bytes:
+            _, stderr = await asyncio.gather(relay_progress(), process.stderr.read())
+            await process.wait()
+            return stderr
+
+        try:
+            stderr = await asyncio.wait_for(communicate(), ANALYSIS_JOB_TIMEOUT_SECONDS or None)
+        except asyncio.TimeoutError:
+            _kill(process)
+            await process.wait()
+            if outcome is not None:
+                # Reported its result, then hung on the way out
+                return outcome
+            error = f"Timed out after {ANALYSIS_JOB_TIMEOUT_SECONDS:g}s"
+            logger.error(f"Failed to process assignment {assignment_id}: {error}")
+            read_guard.mark(student_id=owner, assignment_id=assignment_id)
+            await record_failure(assignment_id, error)
+            broker.publish_assignment_event(assignment_id, "failed", batch_id, error=error)
+            return "failed"
+
+        if process.returncode == 0:
+            logger.info(f"Successfully processed assignment {assignment_id}"
+                        + (f" (batch {batch_id})" if batch_id else ""))
+        else:
+            logger.error(f"Failed to process assignment {assignment_id}: {stderr.decode(errors='replace')}")
+        if outcome is None:
+            outcome = "completed" if process.returncode == 0 else "failed"
+            read_guard.mark(student_id=owner, assignment_id=assignment_id)
+            if outcome == "failed":
+                # The child died without reporting; its last stderr line is the likeliest cause
+                lines = stderr.decode(errors="replace").strip().splitlines()
+                await record_failure(assignment_id, lines[-1] if lines else f"Exit code {process.returncode}")
+            broker.publish_assignment_event(assignment_id, outcome, batch_id)
+        return outcome
+
+
+analysis_queue = AnalysisQueue()
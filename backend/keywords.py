@@ -0,0 +1,100 @@
+"""
+Local keyphrase and topic extraction (RAKE) for building source search queries
+"""
+
+import string
+from collections import Counter, defaultdict
+from typing import List, Tuple, Dict, Optional
+from text_extractor import ExtractedDocument
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being
+below between both but by can could did do does doing down during each either et al etc few for
+from further had has have having he her here hers herself him himself his how however i if in into
+is it its itself just may me might more most must my myself no nor not now of off on once only or
+other our ours ourselves out over own per same shall she should so some such than that the their
+theirs them themselves then there these they this those through thus to too under until up upon us
+very via was we were what when where which while who whom why will with within without would yet
+you your yours yourself yourselves page pages student name date university course professor submitted
+assignment essay introduction conclusion references figure table chapter section abstract
+""".split())
+
+# Punctuation that ends a candidate phrase when it trails a token
+_PHRASE_BREAK = set(".,;:!?()[]{}\"'“”‘’")
+
+MAX_PHRASE_WORDS = 3
+
+
+def _candidate_phrases(document: ExtractedDocument) -> List[Tuple[str, ...]]:
+    """Split the token stream into runs of content words between stopwords,
+    punctuation and line breaks"""
+    phrases = []
+    current = []
+    line_starts = set(document.line_offsets)
+    for token, offset in zip(document.tokens, document.token_offsets):
+        if offset in line_starts and current:
+            phrases.append(tuple(current))
+            current = []
+        word = token.strip(string.punctuation + "“”‘’")
+        breaks_after = token[-1] in _PHRASE_BREAK
+        if (not word or word in STOPWORDS or len(word) < 3
+                or not any(ch.isalpha() for ch in word)):
+            if current:
+                phrases.append(tuple(current))
+            current = []
+            continue
+        current.append(word)
+        if breaks_after or len(current) == MAX_PHRASE_WORDS:
+            phrases.append(tuple(current))
+            current = []
+    if current:
+        phrases.append(tuple(current))
+    return phrases
+
+
+def extract_keyphrases(document: ExtractedDocument, top_n: int = 10,
+                       idf: Optional[Dict[str, float]] = None) -> List[Tuple[str, float]]:
+    """Rank the document's keyphrases with RAKE word-degree scores.
+
+    Runs over the document's already-normalized tokens in linear time, so it
+    costs milliseconds even for long theses. ``idf`` optionally weights words
+    by inverse document frequency against a reference corpus.
+    """
+    phrases = _candidate_phrases(document)
+    if not phrases:
+        return []
+
+    degree = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            degree[word] += len(phrase)
+
+    # Degree (rather than degree/frequency) favours words that recur across phrases
+    word_score = {
+        word: degree[word] * (idf.get(word, 1.0) if idf else 1.0)
+        for word in degree
+    }
+
+    # Repeated phrases matter more than one-off long runs such as a title page
+    phrase_counts = Counter(phrases)
+    scored = {
+        phrase: sum(word_score[word] for word in phrase) * count
+        for phrase, count in phrase_counts.items()
+    }
+    ranked = sorted(scored.items(), key=lambda item: item[1], reverse=True)
+    return [(" ".join(phrase), round(score, 3)) for phrase, score in ranked[:top_n]]
+
+
+def topic_and_query(document: ExtractedDocument, max_query_words: int = 8) -> Tuple[str, str, List[str]]:
+    """Derive a topic label, a source search query and key themes from a document"""
+    keyphrases = [phrase for phrase, _ in extract_keyphrases(document)]
+    if not keyphrases:
+        return "General Topic", "academic research", []
+
+    query_words = []
+    for phrase in keyphrases:
+        for word in phrase.split():
+            if word not in query_words:
+                query_words.append(word)
+    topic = keyphrases[0].title()
+    return topic, " ".join(query_words[:max_query_words]), keyphrases[:5]
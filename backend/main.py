@@ -1,26 +1,53 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse, Response
 import jwt
 import os
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List
 import uuid
+import time
 import asyncio
-import httpx
-from sqlalchemy.orm import Session
-from models import get_db, Student, Assignment, AnalysisResult
-from auth import verify_token, get_current_student
+import zipfile
+import json
+import base64
+import orjson
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import get_async_db, get_schema_version, SCHEMA_VERSION, Student, Assignment, AnalysisResult
+from auth import verify_token, get_current_principal, StudentPrincipal, student_cache
+from passwords import hasher, hash_stats, PasswordHasherBusy
 from rag_service import RAGService
+from storage import (
+    UPLOAD_DIR, MAX_UPLOAD_SIZE, MAX_BATCH_UPLOAD_SIZE, MAX_BATCH_FILES, ALLOWED_EXTENSIONS,
+    UploadTooLarge, stream_upload_to_disk, store_content_addressed, extract_zip_members, file_extension
+)
+from dedup import reuse_existing_analysis, dedup_stats, storage_stats
+from run_stats import performance_report
+from job_queue import analysis_queue, ANALYSIS_RECOVERY_ENABLED
+from db_routing import read_guard, read_router
+from result_cache import result_cache, CachedResult, analysis_etag, etag_matches, fields_etag
+from compression import CompressionMiddleware, choose_encoding, compress, weak_etag, COMPRESSION_MIN_SIZE
+from events import broker, assignment_topic, batch_topic, format_sse, SubscriberQueue, TERMINAL_EVENTS
+from metrics import MetricsMiddleware, register_runtime_collector
+from profiling import ProfilingMiddleware, PROFILE_ADMIN_TOKEN, PROFILE_TOKEN_HEADER, token_matches, list_profiles, profile_path
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Academic Assignment Helper & Plagiarism Detector", version="1.0.0")
+app = FastAPI(
+    title="Academic Assignment Helper & Plagiarism Detector",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
+
+# Compress large complete responses (streams such as SSE pass through)
+app.add_middleware(CompressionMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -31,6 +58,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Multipart framing overhead tolerated on top of MAX_UPLOAD_SIZE before rejecting
+UPLOAD_FRAMING_ALLOWANCE = 64 * 1024
+
+@app.middleware("http")
+async def guard_uploads(request: Request, call_next):
+    """Reject uploads when overloaded or by Content-Length, before the multipart body is parsed"""
+    limits = {"/upload": MAX_UPLOAD_SIZE, "/upload/batch": MAX_BATCH_UPLOAD_SIZE}
+    limit = limits.get(request.url.path)
+    if request.method == "POST" and limit is not None:
+        # Admission control: shed load before the body is read when the analysis queue is saturated
+        if analysis_queue.mode == "reject":
+            decision = analysis_queue.admission("interactive" if request.url.path == "/upload" else "bulk")
+            if not decision.admitted:
+                return ORJSONResponse(
+                    status_code=429,
+                    content={
+                        "detail": "Analysis queue is full, please retry later",
+                        "queue_depth": decision.queue_depth,
+                        "estimated_wait_seconds": round(decision.estimated_wait, 1)
+                    },
+                    headers={"Retry-After": str(decision.retry_after)}
+                )
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() \
+                and int(content_length) > limit + UPLOAD_FRAMING_ALLOWANCE:
+            return ORJSONResponse(
+                status_code=413,
+                content={"detail": f"Upload exceeds maximum size of {limit} bytes"}
+            )
+    return await call_next(request)
+
+# Opt-in sampling profiler for slow requests (PROFILING_ENABLED) or ones sent with X-Profile-Token
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so request latency includes compression and the other middleware
+app.add_middleware(MetricsMiddleware)
+register_runtime_collector()
+
 # Security
 security = HTTPBearer()
 
@@ -39,46 +104,24 @@ JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key")
 JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "http://n8n:5678/webhook/assignment")
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Event streams close after this long; clients reconnect or poll
+SSE_MAX_STREAM_SECONDS = int(os.getenv("SSE_MAX_STREAM_SECONDS", "3600"))
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "false").lower() == "true"
 
 # Initialize RAG service
 rag_service = RAGService()
 
 # Database initialization function
 def init_database():
-    """Initialize database with tables and sample data"""
+    """Apply schema migrations and seed sample data"""
     try:
-        from models import create_tables, init_db, engine
-        from sqlalchemy import text
-        
-        logger.info("Initializing database...")
+        from models import run_migrations, init_db
         
-        # Try to enable pgvector extension
-        try:
-            with engine.connect() as conn:
-                conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
-                conn.commit()
-                logger.info("pgvector extension enabled successfully")
-        except Exception as e:
-            logger.warning(f"Could not enable pgvector extension: {e}")
-            logger.info("Continuing without vector support...")
-        
-        # Check if tables exist
-        with engine.connect() as conn:
-            result = conn.execute(text("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name = 'students'
-                );
-            """))
-            tables_exist = result.scalar()
-            
-        if not tables_exist:
-            logger.info("Creating database tables...")
-            create_tables()
-            logger.info("Tables created successfully!")
-        else:
-            logger.info("Tables already exist, skipping creation...")
+        logger.info("Applying database migrations...")
+        run_migrations()
         
         # Initialize sample data
         init_db()
@@ -107,12 +150,12 @@ async def health_check():
 async def database_status():
     """Check database status and tables"""
     try:
-        from models import engine
+        from models import async_engine
         from sqlalchemy import text
         
-        with engine.connect() as conn:
+        async with async_engine.connect() as conn:
             # Check if students table exists
-            result = conn.execute(text("""
+            result = await conn.execute(text("""
                 SELECT EXISTS (
                     SELECT FROM information_schema.tables 
                     WHERE table_schema = 'public' 
@@ -122,7 +165,7 @@ async def database_status():
             students_exists = result.scalar()
             
             # List all tables
-            result = conn.execute(text("""
+            result = await conn.execute(text("""
                 SELECT table_name 
                 FROM information_schema.tables 
                 WHERE table_schema = 'public'
@@ -145,7 +188,7 @@ async def database_status():
 async def init_database_endpoint():
     """Initialize database tables and sample data"""
     try:
-        init_database()
+        await asyncio.to_thread(init_database)
         return {"status": "success", "message": "Database initialized successfully!"}
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
@@ -154,8 +197,44 @@ async def init_database_endpoint():
 # Startup event
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
-    init_database()
+    """Check the schema version and start analysis workers on startup"""
+    # Migrations run out-of-band (`alembic upgrade head`); boot only pays for one query
+    schema_version = await get_schema_version()
+    schema_ready = schema_version == SCHEMA_VERSION
+    if not schema_ready:
+        if DB_AUTO_MIGRATE:
+            logger.info(f"Schema at {schema_version or 'no version'}, migrating to {SCHEMA_VERSION}...")
+            await asyncio.to_thread(init_database)
+            schema_ready = True
+        else:
+            logger.error(
+                f"Database schema is at {schema_version or 'no version'}, expected {SCHEMA_VERSION}; "
+                "run 'alembic upgrade head' in backend/ or POST /init-db"
+            )
+    analysis_queue.start()
+    # Queued and deferred jobs live in memory; pick up the ones a restart dropped
+    if schema_ready and ANALYSIS_RECOVERY_ENABLED:
+        try:
+            await analysis_queue.recover()
+        except Exception as e:
+            logger.error(f"Error re-queueing unfinished analyses: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop analysis workers and the password hashing pool"""
+    await analysis_queue.stop()
+    hasher.shutdown()
+
+async def _run_hasher(operation):
+    """Await a password pool operation, turning overload into 503 with Retry-After"""
+    try:
+        return await operation
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication is busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
 
 @app.post("/auth/register")
 async def register_student(
@@ -163,28 +242,28 @@ async def register_student(
     password: str = Form(...),
     full_name: str = Form(...),
     student_id: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register a new student account"""
     # Check if student already exists
-    existing_student = db.query(Student).filter(Student.email == email).first()
+    existing_student = await db.scalar(select(Student).where(Student.email == email))
     if existing_student:
         raise HTTPException(
             status_code=400,
             detail="Email already registered"
         )
     
-    # Create new student (in production, hash the password)
+    # Hash on the password pool so bcrypt never blocks the event loop
     student = Student(
         email=email,
-        password_hash=password,  # In production, use proper password hashing
+        password_hash=await _run_hasher(hasher.hash(password)),
         full_name=full_name,
         student_id=student_id
     )
     
     db.add(student)
-    db.commit()
-    db.refresh(student)
+    await db.commit()
+    await db.refresh(student)
     
     return {"message": "Student registered successfully", "student_id": student.id}
 
@@ -192,17 +271,26 @@ async def register_student(
 async def login_student(
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Login student and return JWT token"""
-    student = db.query(Student).filter(Student.email == email).first()
+    student = await db.scalar(select(Student).where(Student.email == email))
     
-    if not student or student.password_hash != password:  # In production, verify hashed password
+    valid, new_hash = await _run_hasher(
+        hasher.verify(password, student.password_hash if student else None)
+    )
+    if not valid:
         raise HTTPException(
             status_code=401,
             detail="Invalid credentials"
         )
     
+    # Upgrade plain-text or outdated-cost hashes while we have the password
+    if new_hash:
+        student.password_hash = new_hash
+        await db.commit()
+        student_cache.invalidate(student.id)
+    
     # Create JWT token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = jwt.encode(
@@ -224,9 +312,10 @@ async def login_student(
 
 @app.post("/upload")
 async def upload_assignment(
+    request: Request,
     file: UploadFile = File(...),
-    current_student: Student = Depends(get_current_student),
-    db: Session = Depends(get_db)
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload assignment file and trigger n8n analysis"""
     
@@ -238,119 +327,622 @@ async def upload_assignment(
             detail="Only PDF and Word documents are allowed"
         )
     
-    # Create assignment record first
+    # Stream the file to a staging path; oversized uploads are rejected before a record exists
+    extension = file_extension(file.filename)
+    staging_path = os.path.join(UPLOAD_DIR, f"incoming-{uuid.uuid4().hex}.{extension}")
+    try:
+        stored = await stream_upload_to_disk(file, staging_path)
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File exceeds maximum upload size of {e.limit} bytes"
+        )
+    
+    # Create assignment record
     assignment = Assignment(
         student_id=current_student.id,
         filename=file.filename,
         original_text="",  # Will be filled by processing
         topic="",  # Will be filled by processing
         academic_level="",  # Will be filled by processing
-        word_count=0  # Will be filled by processing
+        word_count=0,  # Will be filled by processing
+        file_hash=stored.sha256,
+        file_size=stored.size
     )
     
     db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
+    await db.commit()
+    await db.refresh(assignment)
+    # Lets a profile of this request be found by assignment
+    request.state.assignment_id = assignment.id
+    # Follow-up reads by this student go to the primary until replicas catch up
+    read_guard.mark(student_id=current_student.id)
     
-    # Save file locally with assignment ID for easier processing
-    file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'pdf'
-    file_path = f"uploads/{assignment.id}.{file_extension}"
+    # Keep one copy per distinct content in the content-addressed store
+    file_path, is_duplicate_file = store_content_addressed(stored, extension)
+    
+    # Identical content that was already analyzed gets its results cloned instead of re-analyzed
+    if is_duplicate_file and await reuse_existing_analysis(db, assignment):
+        await db.commit()
+        read_guard.mark(student_id=current_student.id, assignment_id=assignment.id)
+        return {
+            "message": "Assignment uploaded successfully",
+            "assignment_id": assignment.id,
+            "analysis_job_id": assignment.id,
+            "deduplicated": True
+        }
     
-    os.makedirs("uploads", exist_ok=True)
+    # Hand the analysis to the worker pool; results are fetched via /analysis/{id}
+    # An upload sent with the profiling token also has its analysis profiled
+    queued = analysis_queue.submit(
+        assignment.id, owner=current_student.id, cost=stored.size, priority="interactive",
+        profile=token_matches(request.headers.get(PROFILE_TOKEN_HEADER))
+    )
     
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    return {
+        "message": "Assignment uploaded successfully",
+        "assignment_id": assignment.id,
+        "analysis_job_id": assignment.id,  # Using assignment ID as job ID
+        "deduplicated": False,
+        "deferred": not queued
+    }
+
+def _discard_staged(staged):
+    """Remove staged files of a rejected batch"""
+    for _, _, stored in staged:
+        if os.path.exists(stored.path):
+            os.remove(stored.path)
+
+@app.post("/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Upload a zip archive and/or several documents and analyze them in parallel"""
+    batch_id = uuid.uuid4().hex
+    staged = []  # (filename, extension, StoredUpload)
     
-    # Process assignment directly (simplified version)
     try:
-        # Run the processing script directly
-        import subprocess
-        import sys
-        
-        result = subprocess.run([
-            sys.executable, "process_assignment.py", str(assignment.id)
-        ], capture_output=True, text=True, cwd="/app")
-        
-        if result.returncode == 0:
-            logger.info(f"Successfully processed assignment {assignment.id}")
-        else:
-            logger.error(f"Failed to process assignment {assignment.id}: {result.stderr}")
+        for upload in files:
+            name = upload.filename or ""
+            extension = file_extension(name, default="")
             
-    except Exception as e:
-        logger.error(f"Failed to process assignment: {str(e)}")
-        # Don't fail the upload if processing fails, just log the error
+            if extension == "zip":
+                archive_path = os.path.join(UPLOAD_DIR, f"incoming-{uuid.uuid4().hex}.zip")
+                archive = await stream_upload_to_disk(upload, archive_path, max_bytes=MAX_BATCH_UPLOAD_SIZE)
+                try:
+                    members = await asyncio.to_thread(
+                        extract_zip_members, archive.path, MAX_BATCH_FILES - len(staged)
+                    )
+                finally:
+                    os.remove(archive.path)
+                staged.extend((member, member.rsplit('.', 1)[-1].lower(), stored) for member, stored in members)
+            elif extension in ALLOWED_EXTENSIONS:
+                if len(staged) >= MAX_BATCH_FILES:
+                    raise ValueError(f"Batch contains more than {MAX_BATCH_FILES} documents")
+                staging_path = os.path.join(UPLOAD_DIR, f"incoming-{uuid.uuid4().hex}.{extension}")
+                staged.append((name, extension, await stream_upload_to_disk(upload, staging_path)))
+            else:
+                raise ValueError(f"Unsupported file in batch: {name}")
+    except UploadTooLarge as e:
+        _discard_staged(staged)
+        raise HTTPException(status_code=413, detail=f"File exceeds maximum upload size of {e.limit} bytes")
+    except zipfile.BadZipFile:
+        _discard_staged(staged)
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    except ValueError as e:
+        _discard_staged(staged)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        _discard_staged(staged)
+        raise
+    
+    if not staged:
+        raise HTTPException(status_code=400, detail="No PDF or Word documents found in batch")
+    
+    # Create all assignment rows in a single flush
+    assignments = [
+        Assignment(
+            student_id=current_student.id,
+            filename=name,
+            original_text="",
+            topic="",
+            academic_level="",
+            word_count=0,
+            file_hash=stored.sha256,
+            file_size=stored.size,
+            batch_id=batch_id
+        )
+        for name, _, stored in staged
+    ]
+    db.add_all(assignments)
+    await db.flush()
+    
+    to_analyze = []
+    deduplicated = 0
+    for assignment, (_, extension, stored) in zip(assignments, staged):
+        _, is_duplicate_file = store_content_addressed(stored, extension)
+        if is_duplicate_file and await reuse_existing_analysis(db, assignment):
+            deduplicated += 1
+        else:
+            to_analyze.append((assignment.id, stored.size))
+    assignment_ids = [assignment.id for assignment in assignments]
+    await db.commit()
+    read_guard.mark(student_id=current_student.id)
+    
+    deferred = sum(
+        not analysis_queue.submit(
+            assignment_id, batch_id=batch_id, owner=current_student.id, cost=size, priority="bulk"
+        )
+        for assignment_id, size in to_analyze
+    )
     
     return {
-        "message": "Assignment uploaded successfully",
-        "assignment_id": assignment.id,
-        "analysis_job_id": assignment.id  # Using assignment ID as job ID
+        "message": "Batch uploaded successfully",
+        "batch_id": batch_id,
+        "assignment_ids": assignment_ids,
+        "total": len(assignment_ids),
+        "deduplicated": deduplicated,
+        "deferred": deferred
+    }
+
+async def get_async_read_db(
+    request: Request,
+    current_student: StudentPrincipal = Depends(get_current_principal)
+):
+    """Session for read-only endpoints: a replica unless the caller wrote recently"""
+    assignment_id = request.path_params.get("assignment_id", "")
+    factory = read_router.sessionmaker(
+        student_id=current_student.id,
+        assignment_id=int(assignment_id) if str(assignment_id).isdigit() else None
+    )
+    async with factory() as db:
+        yield db
+
+def _encode_history_cursor(uploaded_at: datetime, assignment_id: int) -> str:
+    raw = json.dumps([uploaded_at.isoformat(), assignment_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_history_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        uploaded_at, assignment_id = json.loads(raw)
+        return datetime.fromisoformat(uploaded_at), int(assignment_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid cursor"
+        )
+
+@app.get("/assignments")
+async def list_assignments(
+    limit: int = HISTORY_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """List the student's assignments, newest first, with keyset pagination"""
+    limit = max(1, min(limit, MAX_HISTORY_PAGE_SIZE))
+    
+    # Correlated lookups of the first result keep one row per assignment and are
+    # answered from ix_analysis_results_assignment_cover
+    first_result = select(AnalysisResult.id).where(
+        AnalysisResult.assignment_id == Assignment.id
+    ).order_by(AnalysisResult.id).limit(1)
+    result_score = select(AnalysisResult.plagiarism_score).where(
+        AnalysisResult.assignment_id == Assignment.id
+    ).order_by(AnalysisResult.id).limit(1)
+    
+    query = select(
+        Assignment.id,
+        Assignment.filename,
+        Assignment.topic,
+        Assignment.word_count,
+        Assignment.uploaded_at,
+        Assignment.analysis_failed_at,
+        first_result.scalar_subquery().label("result_id"),
+        result_score.scalar_subquery().label("plagiarism_score")
+    ).where(
+        Assignment.student_id == current_student.id
+    )
+    if cursor:
+        # Seek past the last row of the previous page instead of using OFFSET
+        uploaded_at, assignment_id = _decode_history_cursor(cursor)
+        query = query.where(
+            tuple_(Assignment.uploaded_at, Assignment.id) < tuple_(uploaded_at, assignment_id)
+        )
+    rows = (await db.execute(
+        query.order_by(Assignment.uploaded_at.desc(), Assignment.id.desc()).limit(limit + 1)
+    )).all()
+    
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = _encode_history_cursor(last.uploaded_at, last.id)
+    
+    return {
+        "assignments": [
+            {
+                "assignment_id": row.id,
+                "filename": row.filename,
+                "topic": row.topic,
+                "word_count": row.word_count,
+                "uploaded_at": row.uploaded_at,
+                "status": _analysis_state(row.result_id, row.analysis_failed_at),
+                "plagiarism_score": row.plagiarism_score
+            }
+            for row in page
+        ],
+        "next_cursor": next_cursor
+    }
+
+@app.get("/batch/{batch_id}")
+async def get_batch_status(
+    batch_id: str,
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Report aggregate analysis progress for a batch upload"""
+    rows = (await db.execute(
+        select(
+            Assignment.id,
+            Assignment.filename,
+            func.count(AnalysisResult.id),
+            Assignment.analysis_failed_at
+        ).outerjoin(
+            AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+        ).where(
+            Assignment.batch_id == batch_id,
+            Assignment.student_id == current_student.id
+        ).group_by(Assignment.id, Assignment.filename, Assignment.analysis_failed_at).order_by(Assignment.id)
+    )).all()
+    
+    if not rows:
+        raise HTTPException(
+            status_code=404,
+            detail="Batch not found"
+        )
+    
+    statuses = [
+        (assignment_id, filename, _analysis_state(results or None, failed_at))
+        for assignment_id, filename, results, failed_at in rows
+    ]
+    completed = sum(1 for *_, state in statuses if state == "completed")
+    failed = sum(1 for *_, state in statuses if state == "failed")
+    return {
+        "batch_id": batch_id,
+        "total": len(rows),
+        "completed": completed,
+        "failed": failed,
+        "pending": len(rows) - completed - failed,
+        "progress": (completed + failed) / len(rows),
+        "assignments": [
+            {
+                "assignment_id": assignment_id,
+                "filename": filename,
+                "status": state
+            }
+            for assignment_id, filename, state in statuses
+        ]
     }
 
 @app.get("/analysis/{assignment_id}")
 async def get_analysis(
     assignment_id: int,
-    current_student: Student = Depends(get_current_student),
-    db: Session = Depends(get_db)
+    request: Request,
+    fields: Optional[str] = None,
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Retrieve analysis results for an assignment"""
+    """Retrieve analysis results for an assignment.
+
+    ``fields`` is a comma-separated list of keys to return, e.g.
+    ``topic,analysis.plagiarism_score``, so clients can skip heavy fields.
+    """
+    # Completed results are immutable, so a cached payload can be served without the database
+    cached = result_cache.get(assignment_id, current_student.id)
+    if cached:
+        return _analysis_response(cached, request, fields)
     
-    # Verify assignment belongs to current student
-    assignment = db.query(Assignment).filter(
-        Assignment.id == assignment_id,
-        Assignment.student_id == current_student.id
-    ).first()
+    # Ownership check, assignment fields and the result in one round-trip
+    row = (await db.execute(
+        select(
+            Assignment.filename,
+            Assignment.topic,
+            Assignment.academic_level,
+            Assignment.word_count,
+            Assignment.analysis_failed_at,
+            Assignment.analysis_error,
+            AnalysisResult.id.label("result_id"),
+            AnalysisResult.suggested_sources,
+            AnalysisResult.plagiarism_score,
+            AnalysisResult.flagged_sections,
+            AnalysisResult.research_suggestions,
+            AnalysisResult.citation_recommendations,
+            AnalysisResult.confidence_score,
+            AnalysisResult.analyzed_at
+        ).outerjoin(
+            AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+        ).where(
+            Assignment.id == assignment_id,
+            Assignment.student_id == current_student.id
+        ).order_by(AnalysisResult.id).limit(1)
+    )).first()
     
-    if not assignment:
+    if not row:
         raise HTTPException(
             status_code=404,
             detail="Assignment not found"
         )
     
-    # Get analysis results
-    analysis = db.query(AnalysisResult).filter(
-        AnalysisResult.assignment_id == assignment_id
-    ).first()
+    if row.result_id is None and row.analysis_failed_at is not None:
+        return {
+            "assignment_id": assignment_id,
+            "status": "failed",
+            "message": "Analysis failed",
+            "error": row.analysis_error,
+            "failed_at": row.analysis_failed_at
+        }
     
-    if not analysis:
+    if row.result_id is None:
         return {
             "assignment_id": assignment_id,
             "status": "processing",
             "message": "Analysis is still in progress"
         }
     
-    return {
+    payload = {
         "assignment_id": assignment_id,
-        "filename": assignment.filename,
-        "topic": assignment.topic,
-        "academic_level": assignment.academic_level,
-        "word_count": assignment.word_count,
+        "filename": row.filename,
+        "topic": row.topic,
+        "academic_level": row.academic_level,
+        "word_count": row.word_count,
         "analysis": {
-            "suggested_sources": analysis.suggested_sources,
-            "plagiarism_score": analysis.plagiarism_score,
-            "flagged_sections": analysis.flagged_sections,
-            "research_suggestions": analysis.research_suggestions,
-            "citation_recommendations": analysis.citation_recommendations,
-            "confidence_score": analysis.confidence_score,
-            "analyzed_at": analysis.analyzed_at
+            "suggested_sources": row.suggested_sources,
+            "plagiarism_score": row.plagiarism_score,
+            "flagged_sections": row.flagged_sections,
+            "research_suggestions": row.research_suggestions,
+            "citation_recommendations": row.citation_recommendations,
+            "confidence_score": row.confidence_score,
+            "analyzed_at": row.analyzed_at
         }
     }
+    cached = CachedResult(
+        student_id=current_student.id,
+        etag=analysis_etag(assignment_id, row.result_id),
+        payload=payload,
+        body=orjson.dumps(payload)
+    )
+    result_cache.put(assignment_id, cached)
+    return _analysis_response(cached, request, fields)
+
+def _parse_fields(fields: Optional[str]) -> Optional[frozenset]:
+    if not fields:
+        return None
+    return frozenset(name.strip() for name in fields.split(",") if name.strip()) or None
+
+def _select_fields(payload: dict, selected: frozenset, always=("assignment_id",)) -> dict:
+    """Keep the named keys; nested keys are addressed as ``parent.child``"""
+    result = {}
+    for key, value in payload.items():
+        if key in always or key in selected:
+            result[key] = value
+        elif isinstance(value, dict):
+            nested = {name: item for name, item in value.items() if f"{key}.{name}" in selected}
+            if nested:
+                result[key] = nested
+    return result
+
+def _analysis_response(cached: CachedResult, request: Request, fields: Optional[str]) -> Response:
+    selected = _parse_fields(fields)
+    if selected:
+        # Subsets are small and cheap to render, so render before the conditional check
+        etag = fields_etag(cached.etag, selected)
+        body = orjson.dumps(_select_fields(cached.payload, selected))
+    else:
+        etag = cached.etag
+        body = cached.body
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    if len(body) < COMPRESSION_MIN_SIZE:
+        encoding = None
+    headers = {
+        # Each content coding is a different byte sequence, so only the identity body keeps the strong tag
+        "ETag": weak_etag(etag) if encoding else etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    if encoding:
+        if selected:
+            body = compress(body, encoding)
+        else:
+            # The full payload is compressed once per coding and reused from the cache
+            if encoding not in cached.encoded:
+                cached.encoded[encoding] = compress(body, encoding)
+            body = cached.encoded[encoding]
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _analysis_state(result_id, failed_at) -> str:
+    if result_id is not None:
+        return "completed"
+    return "failed" if failed_at is not None else "processing"
+
+async def _finished_events(pending_ids: set, student_id: int, batch_id: Optional[str] = None) -> list:
+    """Terminal events, read from the database, for pending assignments that have finished"""
+    factory = read_router.sessionmaker(student_id=student_id)
+    async with factory() as db:
+        rows = (await db.execute(
+            select(Assignment.id, AnalysisResult.id, Assignment.analysis_failed_at, Assignment.analysis_error).outerjoin(
+                AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+            ).where(Assignment.id.in_(pending_ids))
+        )).all()
+    events = {}
+    for assignment_id, result_id, failed_at, error in rows:
+        state = _analysis_state(result_id, failed_at)
+        if state == "processing" or events.get(assignment_id, {}).get("event") == "completed":
+            continue
+        event = {"assignment_id": assignment_id, "event": state}
+        if state == "failed":
+            event["error"] = error
+        if batch_id:
+            event["batch_id"] = batch_id
+        events[assignment_id] = event
+    return list(events.values())
+
+async def _event_stream(topic: str, queue: SubscriberQueue, initial_events: list, pending_ids: set,
+                        student_id: int, final_event=None, batch_id: Optional[str] = None):
+    """Yield Server-Sent Events until every pending assignment reaches a terminal event.
+
+    Each heartbeat, and any time the subscriber queue overflowed, the pending
+    assignments are checked against the database, so a missed event or a job
+    lost with a restarted worker cannot hold the stream open for ever. The
+    stream also ends after SSE_MAX_STREAM_SECONDS.
+    """
+    deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+    try:
+        for event in initial_events:
+            yield format_sse(event)
+        while pending_ids:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            resync = queue.overflowed and queue.empty()
+            if not resync:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=min(SSE_HEARTBEAT_SECONDS, remaining))
+                except asyncio.TimeoutError:
+                    resync = True
+            if resync:
+                queue.overflowed = False
+                try:
+                    finished = await _finished_events(pending_ids, student_id, batch_id)
+                except Exception as e:
+                    logger.error(f"Could not refresh event stream {topic}: {str(e)}")
+                    finished = []
+                for event in finished:
+                    yield format_sse(event)
+                    pending_ids.discard(event["assignment_id"])
+                yield ": keep-alive\n\n"
+                continue
+            if event["assignment_id"] not in pending_ids:
+                continue
+            yield format_sse(event)
+            if event["event"] in TERMINAL_EVENTS:
+                pending_ids.discard(event["assignment_id"])
+        if final_event:
+            yield format_sse(final_event)
+    finally:
+        broker.unsubscribe(topic, queue)
+
+def _sse_response(generator) -> StreamingResponse:
+    return StreamingResponse(
+        generator,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/analysis/{assignment_id}/events")
+async def stream_analysis_events(
+    assignment_id: int,
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Push stage-progress and completion events for an assignment"""
+    # Subscribe before checking the database so a completion in between is not missed
+    topic = assignment_topic(assignment_id)
+    queue = broker.subscribe(topic)
+    try:
+        row = (await db.execute(
+            select(Assignment.id, AnalysisResult.id, Assignment.analysis_failed_at, Assignment.analysis_error).outerjoin(
+                AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+            ).where(
+                Assignment.id == assignment_id,
+                Assignment.student_id == current_student.id
+            ).limit(1)
+        )).first()
+    finally:
+        # Do not hold a pooled connection for the lifetime of the stream
+        await db.close()
+    
+    if not row:
+        broker.unsubscribe(topic, queue)
+        raise HTTPException(
+            status_code=404,
+            detail="Assignment not found"
+        )
+    
+    state = _analysis_state(row[1], row[2])
+    initial = {"assignment_id": assignment_id, "event": state}
+    if state == "failed":
+        initial["error"] = row[3]
+    pending = {assignment_id} if state == "processing" else set()
+    return _sse_response(_event_stream(topic, queue, [initial], pending, current_student.id))
+
+@app.get("/batch/{batch_id}/events")
+async def stream_batch_events(
+    batch_id: str,
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Push per-assignment progress events for a batch until every analysis finishes"""
+    topic = batch_topic(batch_id)
+    queue = broker.subscribe(topic)
+    try:
+        rows = (await db.execute(
+            select(Assignment.id, func.count(AnalysisResult.id), Assignment.analysis_failed_at).outerjoin(
+                AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+            ).where(
+                Assignment.batch_id == batch_id,
+                Assignment.student_id == current_student.id
+            ).group_by(Assignment.id, Assignment.analysis_failed_at)
+        )).all()
+    finally:
+        await db.close()
+    
+    if not rows:
+        broker.unsubscribe(topic, queue)
+        raise HTTPException(
+            status_code=404,
+            detail="Batch not found"
+        )
+    
+    pending = {assignment_id for assignment_id, results, failed_at in rows if not results and failed_at is None}
+    failed = sum(1 for _, results, failed_at in rows if not results and failed_at is not None)
+    snapshot = {
+        "event": "progress",
+        "batch_id": batch_id,
+        "total": len(rows),
+        "completed": len(rows) - len(pending) - failed,
+        "failed": failed
+    }
+    final = {"event": "batch_completed", "batch_id": batch_id, "total": len(rows)}
+    return _sse_response(_event_stream(topic, queue, [snapshot], pending, current_student.id, final, batch_id))
 
 @app.get("/sources")
 async def search_sources(
     query: str,
     limit: int = 10,
-    current_student: Student = Depends(get_current_student)
+    fields: Optional[str] = None,
+    current_student: StudentPrincipal = Depends(get_current_principal)
 ):
-    """Search academic sources using RAG"""
+    """Search academic sources using RAG; ``fields`` selects the keys returned per source"""
     
     try:
         sources = await rag_service.search_sources(query, limit)
-        return {
+        selected = _parse_fields(fields)
+        if selected:
+            sources = [_select_fields(source, selected, always=("id",)) for source in sources]
+        # Already JSON-safe, so skip FastAPI's encoder pass
+        return ORJSONResponse({
             "query": query,
             "sources": sources,
             "total_found": len(sources)
-        }
+        })
     except Exception as e:
         logger.error(f"Error searching sources: {str(e)}")
         raise HTTPException(
@@ -358,6 +950,60 @@ async def search_sources(
             detail="Error searching academic sources"
         )
 
+def require_admin_token(request: Request):
+    """Profiles and internal pool figures are only served to holders of PROFILE_ADMIN_TOKEN"""
+    if not PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is not configured")
+    if not token_matches(request.headers.get(PROFILE_TOKEN_HEADER)):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+@app.get("/auth/hash-stats", dependencies=[Depends(require_admin_token)])
+async def password_hash_stats():
+    """Report password hashing latency, queueing and rehash counts"""
+    return hash_stats.snapshot()
+
+@app.get("/queue/status")
+async def queue_status():
+    """Report analysis queue depth, drain rate and admission thresholds"""
+    return analysis_queue.status()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: request latency, pipeline stages, OpenAI calls, pools, queue and caches"""
+    return Response(content=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+@app.get("/profiles", dependencies=[Depends(require_admin_token)])
+async def get_profiles(assignment_id: Optional[int] = None, limit: int = 50):
+    """List stored request and analysis profiles, newest first"""
+    limit = max(1, min(limit, 500))
+    return {"profiles": await asyncio.to_thread(list_profiles, assignment_id, limit)}
+
+@app.get("/profiles/{profile_id}", dependencies=[Depends(require_admin_token)])
+async def download_profile(profile_id: str):
+    """Download a profile as folded stacks (flamegraph.pl, speedscope)"""
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
+
+@app.get("/dedup/stats")
+async def deduplication_stats(
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Report how often uploads and analyses are served from identical earlier submissions"""
+    return {**(await storage_stats(db)), **dedup_stats.snapshot()}
+
+@app.get("/reports/analysis-performance")
+async def analysis_performance(
+    since: Optional[datetime] = None,
+    pipeline_version: Optional[str] = None,
+    current_student: StudentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Aggregate recorded stage timings and resource usage per pipeline version"""
+    return await performance_report(db, since=since, pipeline_version=pipeline_version)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
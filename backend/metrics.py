@@ -0,0 +1,248 @@
+"""
+Prometheus metrics: request latency, pipeline stage timings and runtime gauges
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pipeline stages run for seconds to minutes; HTTP handlers for milliseconds
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=REQUEST_BUCKETS
+)
+analysis_stage_duration = Histogram(
+    "analysis_stage_duration_seconds", "Time spent in each analysis pipeline stage",
+    ["stage"], buckets=STAGE_BUCKETS
+)
+analysis_job_duration = Histogram(
+    "analysis_job_duration_seconds", "Wall time of an analysis job including worker start-up",
+    ["outcome"], buckets=STAGE_BUCKETS
+)
+openai_request_duration = Histogram(
+    "openai_request_duration_seconds", "Latency of OpenAI API calls",
+    ["operation"], buckets=STAGE_BUCKETS
+)
+openai_requests = Counter(
+    "openai_requests_total", "OpenAI API calls by outcome",
+    ["operation", "outcome"]
+)
+extraction_cache_requests = Counter(
+    "extraction_cache_requests_total", "Extracted-text cache lookups in the analysis worker",
+    ["result"]
+)
+
+# Metrics the analysis child process may hand back to the API process
+_RELAYABLE = {
+    "analysis_stage_duration_seconds": analysis_stage_duration,
+    "openai_request_duration_seconds": openai_request_duration,
+    "openai_requests_total": openai_requests,
+    "extraction_cache_requests_total": extraction_cache_requests,
+}
+
+# Observations buffered for the parent while running as an analysis child, else None
+_relay: Optional[List[list]] = None
+
+
+def _record(name: str, labels: Dict[str, str], value: float):
+    if _relay is not None:
+        _relay.append([name, labels, value])
+        return
+    metric = _RELAYABLE[name]
+    child = metric.labels(**labels)
+    if isinstance(metric, Histogram):
+        child.observe(value)
+    else:
+        child.inc(value)
+
+
+def enable_relay():
+    """Buffer observations instead of recording them; the child process has no /metrics"""
+    global _relay
+    _relay = []
+
+
+def drain_relay() -> List[list]:
+    """Return and clear the buffered observations"""
+    global _relay
+    observations, _relay = _relay or [], []
+    return observations
+
+
+def replay(observations: List[list]):
+    """Record observations relayed from an analysis child process"""
+    for name, labels, value in observations:
+        if name not in _RELAYABLE:
+            logger.warning(f"Ignoring unknown relayed metric {name}")
+            continue
+        try:
+            _record(name, labels, value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Ignoring malformed relayed metric {name}: {str(e)}")
+
+
+def observe_stage(stage: str, seconds: float):
+    _record("analysis_stage_duration_seconds", {"stage": stage}, max(seconds, 0.0))
+
+
+def observe_extraction_cache(hit: bool):
+    _record("extraction_cache_requests_total", {"result": "hit" if hit else "miss"}, 1)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """Time the enclosed block as a pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def openai_call(operation: str):
+    """Count and time one OpenAI request; an exception counts as an error"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        _record("openai_request_duration_seconds", {"operation": operation}, time.perf_counter() - started)
+        _record("openai_requests_total", {"operation": operation, "outcome": outcome}, 1)
+
+
+def _route_template(scope, path: str, root_path: str) -> str:
+    # The router stores the matched route in the shared scope
+    route = scope.get("route")
+    if route is None:
+        # Answered before routing (upload load shedding) or by a mount: match here, off the hot path.
+        # Mounts rewrite the scope paths, so match against the ones the request arrived with
+        from starlette.routing import Match
+        original = {**scope, "path": path, "root_path": root_path}
+        for candidate in getattr(scope.get("app"), "routes", ()):
+            match, _ = candidate.matches(original)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing requests by method, route template and status.
+
+    Labelling by the matched route (``/analysis/{assignment_id}``) rather than
+    the raw path keeps the series count bounded. Event streams are skipped:
+    their duration is the lifetime of the subscription, not a latency.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        path, root_path = scope["path"], scope.get("root_path", "")
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = dict(message.get("headers") or [])
+                streaming = headers.get(b"content-type", b"").startswith(b"text/event-stream")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not streaming:
+                http_request_duration.labels(scope["method"], _route_template(scope, path, root_path), str(status_code)).observe(
+                    time.perf_counter() - started
+                )
+
+
+def _cache_counters(families: Dict[str, CounterMetricFamily], cache: str, stats: Dict[str, Any],
+                    hits: str = "hits", misses: str = "misses"):
+    families["hits"].add_metric([cache], stats[hits])
+    families["misses"].add_metric([cache], stats[misses])
+
+
+class RuntimeCollector:
+    """Reads pool, queue and cache figures at scrape time so request paths pay nothing"""
+
+    def collect(self):
+        # Imported here: this module is also loaded by the analysis child, which needs none of these
+        from models import async_engine, replica_engines
+        from job_queue import analysis_queue
+        from result_cache import result_cache
+        from auth import student_cache
+        from dedup import dedup_stats
+        from db_routing import read_router
+        from passwords import hasher
+
+        in_use = GaugeMetricFamily("db_pool_connections_in_use", "Connections checked out of the pool", labels=["pool"])
+        size = GaugeMetricFamily("db_pool_size", "Configured pool size", labels=["pool"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections open beyond the pool size", labels=["pool"])
+        pools = [("primary", async_engine)] + [
+            (f"replica{index}", replica_engine) for index, replica_engine in enumerate(replica_engines)
+        ]
+        for name, pool_engine in pools:
+            pool = pool_engine.pool
+            # SQLite and NullPool do not track checkouts
+            if not hasattr(pool, "checkedout"):
+                continue
+            in_use.add_metric([name], pool.checkedout())
+            size.add_metric([name], pool.size())
+            overflow.add_metric([name], max(pool.overflow(), 0))
+        yield in_use
+        yield size
+        yield overflow
+
+        queue = analysis_queue.status()
+        yield GaugeMetricFamily("analysis_queue_depth", "Jobs waiting for a worker", value=queue["queue_depth"])
+        yield GaugeMetricFamily("analysis_queue_running", "Jobs being processed", value=queue["running"])
+        yield GaugeMetricFamily("analysis_queue_deferred", "Jobs held back by admission control", value=queue["deferred"])
+        yield GaugeMetricFamily(
+            "analysis_queue_estimated_wait_seconds", "Expected wait for a newly queued job",
+            value=queue["estimated_wait_seconds"]
+        )
+
+        families = {
+            "hits": CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"]),
+            "misses": CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"]),
+        }
+        _cache_counters(families, "analysis_result", result_cache.snapshot())
+        _cache_counters(families, "student", student_cache.snapshot())
+        _cache_counters(families, "analysis_reuse", dedup_stats.snapshot(),
+                        hits="analysis_reuse_hits", misses="analysis_reuse_misses")
+        yield from families.values()
+
+        routing = read_router.snapshot()
+        reads = CounterMetricFamily("db_reads", "Read sessions by target", labels=["target"])
+        reads.add_metric(["primary"], routing["primary_reads"])
+        reads.add_metric(["replica"], routing["replica_reads"])
+        yield reads
+        yield GaugeMetricFamily("password_hash_pending", "Password hash operations in flight", value=hasher.pending)
+
+
+_collector_registered = False
+
+
+def register_runtime_collector():
+    """Expose runtime gauges on the default registry (API process only, once)"""
+    global _collector_registered
+    if not _collector_registered:
+        REGISTRY.register(RuntimeCollector())
+        _collector_registered = True
@@ -0,0 +1,147 @@
+"""Baseline schema
+
+Creates the tables on an empty database and brings databases created by the
+old startup-time create_all() path up to the same shape.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+import os
+import logging
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Columns added after the initial release, for databases that predate migrations
+LEGACY_UPGRADES = [
+    "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS file_hash VARCHAR(64)",
+    "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS file_size INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_assignments_file_hash ON assignments (file_hash)",
+    "ALTER TABLE assignments ADD COLUMN IF NOT EXISTS batch_id VARCHAR(32)",
+    "CREATE INDEX IF NOT EXISTS ix_assignments_batch_id ON assignments (batch_id)",
+    "CREATE INDEX IF NOT EXISTS ix_assignments_student_history ON assignments "
+    "(student_id, uploaded_at, id) INCLUDE (filename, topic, word_count)",
+    "CREATE INDEX IF NOT EXISTS ix_analysis_results_assignment_cover ON analysis_results "
+    "(assignment_id, id) INCLUDE (plagiarism_score)",
+]
+
+# Large text columns and the TOAST compression method they are stored with (PostgreSQL 14+)
+LARGE_TEXT_COLUMNS = [("assignments", "original_text"), ("academic_sources", "full_text")]
+TEXT_COLUMN_COMPRESSION = os.getenv("TEXT_COLUMN_COMPRESSION", "lz4")
+
+
+def _best_effort(bind, statement: str):
+    """Run an optional statement without aborting the migration transaction"""
+    if context.is_offline_mode():
+        # A generated script has no savepoints to fall back on; emit it and let the DBA decide
+        op.execute(statement)
+        return
+    try:
+        with bind.begin_nested():
+            bind.execute(sa.text(statement))
+    except Exception as e:
+        logger.warning(f"Skipped optional statement ({statement}): {e}")
+
+
+def upgrade():
+    bind = op.get_bind()
+    postgres = bind.dialect.name == "postgresql"
+    # Offline (`--sql`) scripts cannot inspect the target, so they assume an empty database
+    existing = set() if context.is_offline_mode() else set(sa.inspect(bind).get_table_names())
+
+    if postgres:
+        _best_effort(bind, "CREATE EXTENSION IF NOT EXISTS vector")
+
+    if "students" not in existing:
+        op.create_table(
+            "students",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("password_hash", sa.String(), nullable=False),
+            sa.Column("full_name", sa.String(), nullable=False),
+            sa.Column("student_id", sa.String(), nullable=False, unique=True),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_students_id", "students", ["id"])
+        op.create_index("ix_students_email", "students", ["email"], unique=True)
+
+    if "assignments" not in existing:
+        op.create_table(
+            "assignments",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("student_id", sa.Integer(), sa.ForeignKey("students.id"), nullable=False),
+            sa.Column("filename", sa.String(), nullable=False),
+            sa.Column("original_text", sa.Text()),
+            sa.Column("topic", sa.String()),
+            sa.Column("academic_level", sa.String()),
+            sa.Column("word_count", sa.Integer()),
+            sa.Column("file_hash", sa.String(64)),
+            sa.Column("file_size", sa.Integer()),
+            sa.Column("batch_id", sa.String(32)),
+            sa.Column("uploaded_at", sa.DateTime()),
+        )
+        op.create_index("ix_assignments_id", "assignments", ["id"])
+        op.create_index("ix_assignments_file_hash", "assignments", ["file_hash"])
+        op.create_index("ix_assignments_batch_id", "assignments", ["batch_id"])
+        op.create_index(
+            "ix_assignments_student_history", "assignments", ["student_id", "uploaded_at", "id"],
+            postgresql_include=["filename", "topic", "word_count"]
+        )
+
+    if "analysis_results" not in existing:
+        op.create_table(
+            "analysis_results",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("assignment_id", sa.Integer(), sa.ForeignKey("assignments.id"), nullable=False),
+            sa.Column("suggested_sources", JSONB()),
+            sa.Column("plagiarism_score", sa.Float()),
+            sa.Column("flagged_sections", JSONB()),
+            sa.Column("research_suggestions", sa.Text()),
+            sa.Column("citation_recommendations", sa.Text()),
+            sa.Column("confidence_score", sa.Float()),
+            sa.Column("analyzed_at", sa.DateTime()),
+        )
+        op.create_index("ix_analysis_results_id", "analysis_results", ["id"])
+        op.create_index(
+            "ix_analysis_results_assignment_cover", "analysis_results", ["assignment_id", "id"],
+            postgresql_include=["plagiarism_score"]
+        )
+
+    if "academic_sources" not in existing:
+        op.create_table(
+            "academic_sources",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("title", sa.String(), nullable=False),
+            sa.Column("authors", sa.String(), nullable=False),
+            sa.Column("publication_year", sa.Integer()),
+            sa.Column("abstract", sa.Text()),
+            sa.Column("full_text", sa.Text()),
+            sa.Column("source_type", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_academic_sources_id", "academic_sources", ["id"])
+
+    if postgres:
+        if existing:
+            for statement in LEGACY_UPGRADES:
+                op.execute(statement)
+        if TEXT_COLUMN_COMPRESSION:
+            for table, column in LARGE_TEXT_COLUMNS:
+                _best_effort(
+                    bind,
+                    f"ALTER TABLE {table} ALTER COLUMN {column} SET COMPRESSION {TEXT_COLUMN_COMPRESSION}"
+                )
+
+
+def downgrade():
+    for table in ("analysis_results", "academic_sources", "assignments", "students"):
+        op.drop_table(table)
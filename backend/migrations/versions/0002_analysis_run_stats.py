@@ -0,0 +1,41 @@
+"""Record how each analysis ran
+
+Adds per-run timing, resource usage and pipeline version to analysis_results
+for performance reports across deploys.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+RUN_COLUMNS = [
+    sa.Column("pipeline_version", sa.String(64)),
+    sa.Column("duration_seconds", sa.Float()),
+    sa.Column("cpu_seconds", sa.Float()),
+    sa.Column("peak_memory_mb", sa.Float()),
+    sa.Column("sources_scanned", sa.Integer()),
+    sa.Column("run_stats", JSONB()),
+]
+
+
+def upgrade():
+    # Nullable without defaults: existing rows are left as they are
+    for column in RUN_COLUMNS:
+        op.add_column("analysis_results", column)
+    # Performance reports read the most recent results
+    op.create_index("ix_analysis_results_analyzed_at", "analysis_results", ["analyzed_at"])
+
+
+def downgrade():
+    op.drop_index("ix_analysis_results_analyzed_at", table_name="analysis_results")
+    for column in reversed(RUN_COLUMNS):
+        op.drop_column("analysis_results", column.name)
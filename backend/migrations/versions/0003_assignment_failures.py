@@ -0,0 +1,27 @@
+"""Record failed analyses
+
+Stores when and why an assignment's analysis failed, so status endpoints and
+event streams can report it after the fact.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("assignments", sa.Column("analysis_failed_at", sa.DateTime()))
+    op.add_column("assignments", sa.Column("analysis_error", sa.Text()))
+
+
+def downgrade():
+    op.drop_column("assignments", "analysis_error")
+    op.drop_column("assignments", "analysis_failed_at")
@@ -0,0 +1,35 @@
+"""Cover failure state in the history index
+
+The assignment history listing reports failed analyses, so
+ix_assignments_student_history also carries analysis_failed_at to keep the
+listing an index-only scan.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+HISTORY_KEY = ["student_id", "uploaded_at", "id"]
+
+
+def upgrade():
+    op.drop_index("ix_assignments_student_history", table_name="assignments")
+    op.create_index(
+        "ix_assignments_student_history", "assignments", HISTORY_KEY,
+        postgresql_include=["filename", "topic", "word_count", "analysis_failed_at"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_assignments_student_history", table_name="assignments")
+    op.create_index(
+        "ix_assignments_student_history", "assignments", HISTORY_KEY,
+        postgresql_include=["filename", "topic", "word_count"]
+    )
@@ -0,0 +1,35 @@
+"""Claim analyses and keep one result per assignment
+
+Adds assignments.analysis_claimed_at, set atomically by the worker that runs
+an analysis, so a job re-queued by startup recovery is not run twice. Results
+become unique per assignment; earlier duplicates are removed, keeping the
+first one, which is the result the API has been serving.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("assignments", sa.Column("analysis_claimed_at", sa.DateTime()))
+    op.execute(
+        "DELETE FROM analysis_results WHERE id NOT IN "
+        "(SELECT MIN(id) FROM analysis_results GROUP BY assignment_id)"
+    )
+    op.create_index(
+        "uq_analysis_results_assignment_id", "analysis_results", ["assignment_id"], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index("uq_analysis_results_assignment_id", table_name="analysis_results")
+    op.drop_column("assignments", "analysis_claimed_at")
@@ -0,0 +1,143 @@
+"""
+Password hashing on a dedicated, bounded thread pool
+"""
+
+import os
+import hmac
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Dict, Any
+from passlib.context import CryptContext
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+# Hash/verify calls allowed to wait for a worker before new ones are refused
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+# Hashes made with a different cost are flagged for rehash on the next successful login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash operations are already waiting for a worker"""
+
+
+class HashStats:
+    """Process-local latency and outcome counters for password hashing"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operations = {"hash": 0, "verify": 0}
+        self.total_seconds = {"hash": 0.0, "verify": 0.0}
+        self.max_seconds = {"hash": 0.0, "verify": 0.0}
+        self.queue_seconds = 0.0
+        self.rehashes = 0
+        self.legacy_upgrades = 0
+        self.rejected = 0
+
+    def record(self, operation: str, seconds: float, queued: float):
+        with self._lock:
+            self.operations[operation] += 1
+            self.total_seconds[operation] += seconds
+            self.max_seconds[operation] = max(self.max_seconds[operation], seconds)
+            self.queue_seconds += queued
+
+    def count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            completed = sum(self.operations.values())
+            return {
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "workers": PASSWORD_HASH_WORKERS,
+                "pending": hasher.pending,
+                **{
+                    f"{operation}_count": count for operation, count in self.operations.items()
+                },
+                **{
+                    f"{operation}_avg_ms": round(1000 * self.total_seconds[operation] / count, 1) if count else 0.0
+                    for operation, count in self.operations.items()
+                },
+                **{
+                    f"{operation}_max_ms": round(1000 * seconds, 1)
+                    for operation, seconds in self.max_seconds.items()
+                },
+                "avg_queue_ms": round(1000 * self.queue_seconds / completed, 1) if completed else 0.0,
+                "rehashes": self.rehashes,
+                "legacy_upgrades": self.legacy_upgrades,
+                "rejected": self.rejected,
+            }
+
+
+hash_stats = HashStats()
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop with a fixed number of threads.
+
+    bcrypt releases the GIL, so the workers hash in parallel while the loop
+    keeps serving requests; the pending limit sheds load during login storms
+    instead of letting queued logins time out.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def _run(self, operation: str, func, *args):
+        if self.pending >= self.max_pending:
+            hash_stats.count("rejected")
+            raise PasswordHasherBusy()
+        self.pending += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            result = func(*args)
+            hash_stats.record(operation, time.perf_counter() - started, started - submitted)
+            return result
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", pwd_context.hash, password)
+
+    async def verify(self, password: str, stored_hash: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Check a password; returns (valid, replacement hash or None)"""
+        if not stored_hash:
+            # Unknown account: spend the same time as a real check so emails cannot be probed
+            await self._run("verify", pwd_context.dummy_verify)
+            return False, None
+        if pwd_context.identify(stored_hash, required=False) is None:
+            # Rows written before hashing was introduced hold the plain password
+            if not hmac.compare_digest(stored_hash.encode(), password.encode()):
+                return False, None
+            hash_stats.count("legacy_upgrades")
+            return True, await self.hash(password)
+        valid, new_hash = await self._run("verify", pwd_context.verify_and_update, password, stored_hash)
+        if valid and new_hash:
+            hash_stats.count("rehashes")
+        return valid, new_hash
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+hasher = PasswordHasher()
+
+
+def hash_password_sync(password: str) -> str:
+    """Hash outside the event loop (scripts and database seeding)"""
+    return pwd_context.hash(password)
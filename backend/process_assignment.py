@@ -7,10 +7,17 @@ This processes assignments immediately when uploaded
 import asyncio
 import json
 import os
+import time
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from models import get_db, Assignment, AnalysisResult
+from models import get_db, async_engine, replica_engines, Assignment, AnalysisResult
 from rag_service import RAGService
-from text_extractor import TextExtractor
+from text_extractor import TextExtractor, TextSegment
+from storage import assignment_file_path
+from events import report_progress, report_metrics
+import metrics
+import profiling
+import run_stats
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,43 +32,67 @@ async def process_assignment_directly(assignment_id: int):
         assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
         if not assignment:
             print(f"Assignment {assignment_id} not found")
+            report_progress("failed", error="Assignment not found")
             return
-        
+        # Finished by another process since this job was queued
+        existing = db.query(AnalysisResult).filter(AnalysisResult.assignment_id == assignment_id).first()
+        if existing:
+            print(f"Assignment {assignment_id} already analyzed")
+            report_progress("completed", plagiarism_score=existing.plagiarism_score)
+            return
+
         # Initialize RAG service
         rag_service = RAGService()
+        run = run_stats.start_run()
         
         # Extract real text from the uploaded file
-        file_path = f"uploads/{assignment_id}.{assignment.filename.split('.')[-1]}"
-        extracted_text = TextExtractor.extract_text_from_file(file_path)
+        report_progress("extracting")
+        file_path = assignment_file_path(assignment)
+        # Pages are cleaned and counted as they stream out of the extractor
+        started, started_cpu = time.perf_counter(), time.process_time()
+        document = await asyncio.to_thread(TextExtractor.extract_document, file_path, assignment.file_hash)
+        if document:
+            # Parsing and cleaning are interleaved; the document records how long the parser took
+            run.add_stage("extraction", document.parse_seconds, document.parse_cpu_seconds)
+            run.add_stage(
+                "cleaning",
+                time.perf_counter() - started - document.parse_seconds,
+                # process_time() covers this process only, not the extraction pool workers
+                time.process_time() - started_cpu - (document.parse_cpu_seconds - document.worker_cpu_seconds)
+            )
+            run.extraction_cache_hit = document.from_cache
+            metrics.observe_extraction_cache(document.from_cache)
         
-        if not extracted_text:
+        if not document or not document.text:
             # Fallback to simulated text if extraction fails
             extracted_text = f"Text extraction failed for assignment: {assignment.filename}. Using simulated analysis."
             logger.warning(f"Text extraction failed for assignment {assignment_id}")
+            document = TextExtractor.build_document([TextSegment(0, 0, extracted_text)])
         
-        # Clean the extracted text
-        cleaned_text = TextExtractor.clean_text(extracted_text)
+        cleaned_text = document.text
         
         # Analyze content with real text
-        analysis = await rag_service.analyze_assignment_content(cleaned_text)
+        report_progress("analyzing")
+        with run.stage("analysis"):
+            analysis = await rag_service.analyze_assignment_content(cleaned_text, document)
         
         # Detect plagiarism with real text
-        plagiarism = await rag_service.detect_plagiarism(cleaned_text)
+        report_progress("plagiarism")
+        with run.stage("plagiarism"):
+            plagiarism = await rag_service.detect_plagiarism(cleaned_text, document)
         
         # Search for relevant sources based on real content
-        search_query = analysis.get("topic", "academic research")
-        if not search_query or search_query == "Sample Topic":
-            # Extract keywords from the actual text for better search
-            words = cleaned_text.split()[:10]  # First 10 words as keywords
-            search_query = " ".join(words)
+        report_progress("searching")
+        search_query = analysis.get("search_query") or document.leading_words(10)
         
-        sources = await rag_service.search_sources(search_query, limit=5)
+        with run.stage("search"):
+            sources = await rag_service.search_sources(search_query, limit=5)
         
         # Update assignment with real analysis results
         assignment.original_text = cleaned_text
         assignment.topic = analysis.get("topic", "General Topic")
         assignment.academic_level = analysis.get("academic_level", "Undergraduate")
-        assignment.word_count = TextExtractor.get_word_count(cleaned_text)
+        assignment.word_count = document.word_count
         
         # Create analysis result
         analysis_result = AnalysisResult(
@@ -71,11 +102,31 @@ async def process_assignment_directly(assignment_id: int):
             flagged_sections=plagiarism.get("flagged_sections", []),
             research_suggestions=f"Based on the content analysis, consider exploring related academic literature on '{analysis.get('topic', 'General Topic')}'. The assignment contains {assignment.word_count} words and covers key themes that would benefit from additional scholarly sources.",
             citation_recommendations="Use APA format for citations. Ensure all sources are properly cited and referenced.",
-            confidence_score=0.85
+            confidence_score=0.85,
+            **run.finish(
+                plagiarism.get("sources_scanned"),
+                llm_enrichment="ai_analysis" in analysis,
+                sources_returned=len(sources),
+                document={
+                    "characters": len(cleaned_text),
+                    "words": document.word_count,
+                    "segments": document.segment_count,
+                    "file_size": assignment.file_size
+                }
+            )
         )
         
-        db.add(analysis_result)
-        db.commit()
+        with metrics.timed_stage("persist"):
+            db.add(analysis_result)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another run stored its result first (one per assignment); report that one
+                db.rollback()
+                analysis_result = db.query(AnalysisResult).filter(
+                    AnalysisResult.assignment_id == assignment_id
+                ).one()
+        report_progress("completed", plagiarism_score=analysis_result.plagiarism_score)
         
         print(f"✅ Analysis completed for assignment {assignment_id}")
         print(f"   File: {assignment.filename}")
@@ -89,13 +140,27 @@ async def process_assignment_directly(assignment_id: int):
     except Exception as e:
         logger.error(f"Error processing assignment {assignment_id}: {str(e)}")
         db.rollback()
+        report_progress("failed", error=str(e))
     finally:
         db.close()
 
+async def _run_and_dispose(assignment_id: int):
+    # Stage timings are handed to the API process, which serves /metrics
+    metrics.enable_relay()
+    sampler = profiling.start_job_profile()
+    try:
+        await process_assignment_directly(assignment_id)
+    finally:
+        profiling.finish_job_profile(sampler, assignment_id)
+        report_metrics(metrics.drain_relay())
+        # RAGService queries go through the async pools; close them before the loop exits
+        for pool_engine in [async_engine, *replica_engines]:
+            await pool_engine.dispose()
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1:
         assignment_id = int(sys.argv[1])
-        asyncio.run(process_assignment_directly(assignment_id))
+        asyncio.run(_run_and_dispose(assignment_id))
     else:
         print("Usage: python process_assignment.py <assignment_id>")
@@ -0,0 +1,261 @@
+"""
+Opt-in sampling profiler for slow requests and analysis jobs
+"""
+
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import asyncio
+import threading
+from collections import Counter
+from typing import Optional, List, Dict, Any
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Fraction of requests run under the sampler; only the slow ones are kept
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+PROFILE_SLOW_REQUEST_SECONDS = float(os.getenv("PROFILE_SLOW_REQUEST_SECONDS", "2.0"))
+PROFILE_SLOW_JOB_SECONDS = float(os.getenv("PROFILE_SLOW_JOB_SECONDS", "30"))
+PROFILE_INTERVAL_SECONDS = int(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+# Samplers allowed to run at once per process; further requests are not profiled
+PROFILE_MAX_ACTIVE = int(os.getenv("PROFILE_MAX_ACTIVE", "4"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+# Requests carrying this value in X-Profile-Token are always profiled; also guards the download endpoints
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+PROFILE_TOKEN_HEADER = "x-profile-token"
+# Set on the analysis child when the upload that queued it asked for a profile
+PROFILE_JOB_ENV = "PROFILE_JOB"
+
+_PROFILE_ID = re.compile(r"^(request|job)-\d{8}T\d{6}-[0-9a-f]{8}$")
+_SAMPLER_THREAD = "stack-sampler"
+
+
+def token_matches(token: Optional[str]) -> bool:
+    # compare_digest only accepts ASCII str, and headers can carry any latin-1 text
+    return bool(PROFILE_ADMIN_TOKEN) and bool(token) and hmac.compare_digest(
+        token.encode("utf-8"), PROFILE_ADMIN_TOKEN.encode("utf-8")
+    )
+
+
+def valid_profile_id(profile_id: str) -> bool:
+    return bool(_PROFILE_ID.match(profile_id))
+
+
+def _frame_label(code) -> str:
+    # Last two path components tell apart the many __init__.py and main.py files
+    path = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackSampler:
+    """Statistical profiler sampling every thread's stack from a background thread.
+
+    Unlike cProfile it sees work handed to threads (PDF parsing, bcrypt) and
+    costs nothing on the profiled code itself. Stacks are kept in the folded
+    format read by flamegraph.pl and speedscope, rooted at the thread name.
+    On the API the event loop is shared, so a request's profile also contains
+    whatever other requests ran alongside it.
+    """
+
+    active = 0
+    _active_lock = threading.Lock()
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=_SAMPLER_THREAD, daemon=True)
+
+    @classmethod
+    def start(cls, force: bool = False) -> Optional["StackSampler"]:
+        """Start a sampler unless PROFILE_MAX_ACTIVE are already running (forced ones always start)"""
+        with cls._active_lock:
+            if not force and cls.active >= PROFILE_MAX_ACTIVE:
+                return None
+            cls.active += 1
+        sampler = cls()
+        sampler._thread.start()
+        return sampler
+
+    def stop(self) -> float:
+        """Stop sampling; returns the wall time covered"""
+        self._stop.set()
+        self._thread.join()
+        with StackSampler._active_lock:
+            StackSampler.active -= 1
+        return time.perf_counter() - self._started
+
+    def _run(self):
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                name = names.get(thread_id, str(thread_id))
+                if name.startswith(_SAMPLER_THREAD):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(name.replace(";", ","))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def new_profile_id(kind: str) -> str:
+    return f"{kind}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+
+
+def save_profile(sampler: StackSampler, kind: str, duration: float,
+                 profile_id: Optional[str] = None, **details) -> str:
+    """Write a sampler's stacks and a metadata sidecar to PROFILE_DIR; returns the profile id"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = profile_id or new_profile_id(kind)
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded"), "w", encoding="utf-8") as f:
+        f.write(sampler.folded())
+    meta = {
+        "profile_id": profile_id,
+        "kind": kind,
+        "started_at": sampler.started_at,
+        "duration_seconds": round(duration, 3),
+        "samples": sampler.samples,
+        "interval_ms": round(sampler.interval * 1000, 1),
+        **details,
+    }
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    _prune()
+    logger.info(f"Saved {kind} profile {profile_id} ({duration:.2f}s, {sampler.samples} samples)")
+    return profile_id
+
+
+def _prune():
+    """Keep the newest PROFILE_MAX_FILES profiles"""
+    metas = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in metas[:max(len(metas) - PROFILE_MAX_FILES, 0)]:
+        for suffix in (".json", ".folded"):
+            path = os.path.join(PROFILE_DIR, entry.name[:-len(".json")] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_profiles(assignment_id: Optional[int] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Metadata of stored profiles, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if assignment_id is None or meta.get("assignment_id") == assignment_id:
+            profiles.append(meta)
+    profiles.sort(key=lambda meta: meta.get("started_at", 0), reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    if not valid_profile_id(profile_id):
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+    return path if os.path.exists(path) else None
+
+
+def start_job_profile() -> Optional[StackSampler]:
+    """Profile the analysis child when sampled, or when the upload asked for it"""
+    if os.getenv(PROFILE_JOB_ENV) == "1" or (PROFILING_ENABLED and random.random() < PROFILE_SAMPLE_RATE):
+        # One job per process, so the active limit does not apply
+        return StackSampler.start(force=True)
+    return None
+
+
+def finish_job_profile(sampler: Optional[StackSampler], assignment_id: int) -> Optional[str]:
+    """Stop a job sampler and store the profile if the job was slow or the profile was requested"""
+    if sampler is None:
+        return None
+    duration = sampler.stop()
+    forced = os.getenv(PROFILE_JOB_ENV) == "1"
+    if not forced and duration < PROFILE_SLOW_JOB_SECONDS:
+        return None
+    return save_profile(sampler, "job", duration, assignment_id=assignment_id, forced=forced)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling requests that turn out slow, or that ask for it.
+
+    With PROFILING_ENABLED a PROFILE_SAMPLE_RATE share of requests runs under a
+    StackSampler, and profiles of those slower than PROFILE_SLOW_REQUEST_SECONDS
+    are stored. A request with a matching X-Profile-Token header is always
+    profiled and stored, and its response carries the X-Profile-Id to download.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (PROFILING_ENABLED or PROFILE_ADMIN_TOKEN):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        forced = token_matches(headers.get(PROFILE_TOKEN_HEADER.encode(), b"").decode("latin-1"))
+        sampled = PROFILING_ENABLED and random.random() < PROFILE_SAMPLE_RATE
+        sampler = StackSampler.start(force=forced) if forced or sampled else None
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Forced profiles get their id up front so it can go out in the response headers
+        profile_id = new_profile_id("request") if forced else None
+        status_code = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = dict(message.get("headers") or [])
+                streaming = response_headers.get(b"content-type", b"").startswith(b"text/event-stream")
+                if forced and not streaming:
+                    message = {**message, "headers": [
+                        *message.get("headers", []), (b"x-profile-id", profile_id.encode())
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = sampler.stop()
+            if not streaming and (forced or duration >= PROFILE_SLOW_REQUEST_SECONDS):
+                state = scope.get("state") or {}
+                path_params = scope.get("path_params") or {}
+                assignment_id = state.get("assignment_id") or path_params.get("assignment_id")
+                await asyncio.to_thread(
+                    save_profile, sampler, "request", duration, profile_id,
+                    method=scope["method"], path=scope["path"], status=status_code,
+                    assignment_id=int(assignment_id) if str(assignment_id).isdigit() else None,
+                    forced=forced
+                )
@@ -1,23 +1,35 @@
-import openai
 import os
-from sqlalchemy.orm import Session
-from models import get_db, AcademicSource
-from typing import List, Dict, Any
+from sqlalchemy import select
+from models import AsyncSessionLocal, AcademicSource
+from db_routing import read_router
+from typing import List, Dict, Any, Optional
+from text_extractor import TextExtractor, ExtractedDocument
+from keywords import topic_and_query
+from metrics import openai_call
+from run_stats import record_openai
 import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Set to "false" to skip the LLM round-trip and rely on local keyphrase extraction only
+LLM_ENRICHMENT = os.getenv("LLM_ENRICHMENT", "true").lower() == "true"
+
 class RAGService:
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         if not self.openai_api_key:
             logger.warning("OPENAI_API_KEY not set. RAG functionality will be limited.")
         
-        openai.api_key = self.openai_api_key
         self.embedding_model = "text-embedding-ada-002"
         self.embedding_dimension = 1536
     
+    def _openai(self):
+        """Import the OpenAI client on first use; it dominates process start-up time"""
+        import openai
+        openai.api_key = self.openai_api_key
+        return openai
+    
     async def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for given text using OpenAI"""
         if not self.openai_api_key:
@@ -25,18 +37,44 @@ class RAGService:
             return [0.0] * self.embedding_dimension
         
         try:
-            response = await openai.Embedding.acreate(
-                input=text,
-                model=self.embedding_model
-            )
+            openai = self._openai()
+            with openai_call("embedding"):
+                response = await openai.Embedding.acreate(
+                    input=text,
+                    model=self.embedding_model
+                )
+            record_openai("embedding", response)
             return response['data'][0]['embedding']
         except Exception as e:
+            record_openai("embedding", error=True)
             logger.error(f"Error generating embedding: {str(e)}")
             return [0.0] * self.embedding_dimension
     
+    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts in one OpenAI request"""
+        if not self.openai_api_key:
+            return [[0.0] * self.embedding_dimension for _ in texts]
+        
+        try:
+            openai = self._openai()
+            with openai_call("embedding_batch"):
+                response = await openai.Embedding.acreate(
+                    input=texts,
+                    model=self.embedding_model
+                )
+            record_openai("embedding_batch", response)
+            # Results carry their input position; do not rely on response order
+            ordered = sorted(response['data'], key=lambda item: item['index'])
+            return [item['embedding'] for item in ordered]
+        except Exception as e:
+            record_openai("embedding_batch", error=True)
+            logger.error(f"Error generating embeddings for {len(texts)} texts: {str(e)}")
+            return [[0.0] * self.embedding_dimension for _ in texts]
+    
     async def search_sources(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search for relevant academic sources using vector similarity"""
-        db = next(get_db())
+        # The corpus is read-only here, so any replica will do
+        db = read_router.sessionmaker()()
         
         try:
             # Generate embedding for the query
@@ -44,7 +82,7 @@ class RAGService:
             
             # Search for similar sources using vector similarity
             # Note: This is a simplified version. In production, you'd use proper vector search
-            sources = db.query(AcademicSource).limit(limit).all()
+            sources = (await db.scalars(select(AcademicSource).limit(limit))).all()
             
             # Convert to dictionary format
             results = []
@@ -65,7 +103,7 @@ class RAGService:
             logger.error(f"Error searching sources: {str(e)}")
             return []
         finally:
-            db.close()
+            await db.close()
     
     async def add_academic_source(
         self,
@@ -77,7 +115,7 @@ class RAGService:
         source_type: str
     ) -> int:
         """Add a new academic source to the database"""
-        db = next(get_db())
+        db = AsyncSessionLocal()
         
         try:
             # Generate embedding for the full text
@@ -95,29 +133,38 @@ class RAGService:
             )
             
             db.add(source)
-            db.commit()
-            db.refresh(source)
+            await db.commit()
+            await db.refresh(source)
             
             logger.info(f"Added academic source: {title}")
             return source.id
             
         except Exception as e:
             logger.error(f"Error adding academic source: {str(e)}")
-            db.rollback()
+            await db.rollback()
             return None
         finally:
-            db.close()
+            await db.close()
     
-    async def analyze_assignment_content(self, text: str) -> Dict[str, Any]:
-        """Analyze assignment content using AI"""
-        if not self.openai_api_key:
-            return {
-                "topic": "Sample Topic",
-                "academic_level": "Undergraduate",
-                "key_themes": ["education", "technology"],
-                "research_questions": ["What is the impact of technology on education?"],
-                "word_count": len(text.split())
-            }
+    async def analyze_assignment_content(self, text: str, document: Optional[ExtractedDocument] = None) -> Dict[str, Any]:
+        """Analyze assignment content.
+
+        Topic, key themes and the source search query come from local keyphrase
+        extraction; the LLM, when configured, only adds its free-text analysis.
+        """
+        if document is None:
+            document = TextExtractor.document_from_text(text)
+        topic, search_query, key_themes = topic_and_query(document)
+        local_analysis = {
+            "topic": topic,
+            "academic_level": "Undergraduate",
+            "key_themes": key_themes,
+            "research_questions": [],
+            "word_count": document.word_count,
+            "search_query": search_query
+        }
+        if not self.openai_api_key or not LLM_ENRICHMENT:
+            return local_analysis
         
         try:
             prompt = f"""
@@ -134,54 +181,51 @@ class RAGService:
             Return your analysis in JSON format.
             """
             
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are an academic assistant that analyzes student assignments."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.3
-            )
+            openai = self._openai()
+            with openai_call("chat_analysis"):
+                response = await openai.ChatCompletion.acreate(
+                    model="gpt-3.5-turbo",
+                    messages=[
+                        {"role": "system", "content": "You are an academic assistant that analyzes student assignments."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=500,
+                    temperature=0.3
+                )
+            record_openai("chat_analysis", response)
             
             # Parse the response (in production, you'd want more robust JSON parsing)
             analysis_text = response.choices[0].message.content
             
-            return {
-                "topic": "AI-Generated Topic",
-                "academic_level": "Undergraduate",
-                "key_themes": ["analysis", "research"],
-                "research_questions": ["How can AI assist in academic research?"],
-                "word_count": len(text.split()),
-                "ai_analysis": analysis_text
-            }
+            return {**local_analysis, "ai_analysis": analysis_text}
             
         except Exception as e:
+            record_openai("chat_analysis", error=True)
             logger.error(f"Error analyzing assignment: {str(e)}")
-            return {
-                "topic": "Unknown Topic",
-                "academic_level": "Undergraduate",
-                "key_themes": [],
-                "research_questions": [],
-                "word_count": len(text.split())
-            }
+            return local_analysis
     
-    async def detect_plagiarism(self, text: str) -> Dict[str, Any]:
+    async def detect_plagiarism(self, text: str, document: Optional[ExtractedDocument] = None) -> Dict[str, Any]:
         """Detect potential plagiarism by comparing with academic sources"""
-        db = next(get_db())
+        db = read_router.sessionmaker()()
         
         try:
             # This is a simplified plagiarism detection
             # In production, you'd use more sophisticated algorithms
             
-            # Get all academic sources
-            sources = db.query(AcademicSource).all()
+            # Only the columns compared here; full_text is deferred on the model
+            sources = (await db.execute(
+                select(AcademicSource.title, AcademicSource.full_text).where(
+                    AcademicSource.full_text.isnot(None)
+                )
+            )).all()
             
             plagiarism_score = 0.0
             flagged_sections = []
             
             # Simple word-based similarity check
-            text_words = set(text.lower().split())
+            if document is None:
+                document = TextExtractor.document_from_text(text)
+            text_words = document.token_set
             
             for source in sources:
                 if source.full_text:
@@ -201,7 +245,8 @@ class RAGService:
             return {
                 "plagiarism_score": plagiarism_score,
                 "flagged_sections": flagged_sections,
-                "is_plagiarized": plagiarism_score > 0.3
+                "is_plagiarized": plagiarism_score > 0.3,
+                "sources_scanned": len(sources)
             }
             
         except Exception as e:
@@ -212,4 +257,4 @@ class RAGService:
                 "is_plagiarized": False
             }
         finally:
-            db.close()
+            await db.close()
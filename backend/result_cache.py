@@ -0,0 +1,95 @@
+"""
+In-process cache of rendered analysis payloads with ETag helpers
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, FrozenSet
+
+# Environment variables
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+
+# Bump whenever the shape of the analysis payload changes so clients refetch
+ANALYSIS_PAYLOAD_VERSION = "1"
+
+
+def analysis_etag(assignment_id: int, result_id: int) -> str:
+    """Strong ETag for a completed analysis; results never change once written"""
+    return f'"a{assignment_id}-r{result_id}-v{ANALYSIS_PAYLOAD_VERSION}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluate an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def fields_etag(etag: str, fields: FrozenSet[str]) -> str:
+    """ETag of a field-selected representation of a result"""
+    digest = hashlib.sha1(",".join(sorted(fields)).encode()).hexdigest()[:8]
+    return f'{etag[:-1]}-f{digest}"'
+
+
+@dataclass
+class CachedResult:
+    student_id: int
+    etag: str
+    payload: Dict[str, Any]
+    body: bytes
+    # Compressed copies of ``body`` by content coding, filled on first request
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+class ResultCache:
+    """LRU of serialized completed analyses keyed by assignment id"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, assignment_id: int, student_id: int) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(assignment_id)
+            # Never serve another student's result, even on a hit
+            if entry is None or entry.student_id != student_id:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(assignment_id)
+            self.hits += 1
+            return entry
+
+    def put(self, assignment_id: int, entry: CachedResult):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[assignment_id] = entry
+            self._entries.move_to_end(assignment_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, assignment_id: int):
+        with self._lock:
+            self._entries.pop(assignment_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+result_cache = ResultCache()
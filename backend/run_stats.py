@@ -0,0 +1,224 @@
+"""
+Per-analysis timing and resource usage, and reports over it
+"""
+
+import os
+import math
+import time
+import statistics
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Assignment, AnalysisResult
+import metrics
+import logging
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+# Set to the release tag or commit on deploy so results can be compared across versions
+PIPELINE_VERSION = os.getenv("PIPELINE_VERSION", "1.0.0")
+# Most recent results a performance report looks at
+PERFORMANCE_REPORT_MAX_ROWS = int(os.getenv("PERFORMANCE_REPORT_MAX_ROWS", "5000"))
+
+# Document size classes (words) for latency-vs-size breakdowns
+SIZE_BUCKETS = [(0, 1000), (1000, 5000), (5000, 20000), (20000, None)]
+
+
+def _peak_memory_mb() -> Optional[float]:
+    """Peak resident memory of this process and its finished children (ru_maxrss is KB on Linux)"""
+    if resource is None:
+        return None
+    peak_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    return round(peak_kb / 1024, 1)
+
+
+def _children_cpu_seconds() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RunRecorder:
+    """Collects stage timings and OpenAI usage for one analysis.
+
+    Used in the analysis child process, where one job owns the whole process,
+    so process-wide CPU time and peak RSS describe that job alone.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.openai: Dict[str, Dict[str, int]] = {}
+        self.extraction_cache_hit: Optional[bool] = None
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._children_cpu = _children_cpu_seconds()
+
+    def add_stage(self, stage: str, wall_seconds: float, cpu_seconds: float):
+        self.stages[stage] = {
+            "wall_seconds": round(max(wall_seconds, 0.0), 4),
+            "cpu_seconds": round(max(cpu_seconds, 0.0), 4),
+        }
+        metrics.observe_stage(stage, wall_seconds)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time the enclosed block as a pipeline stage (also reported to /metrics)"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def record_openai(self, operation: str, response=None, error: bool = False):
+        """Count an OpenAI call and the tokens reported in its ``usage``"""
+        entry = self.openai.setdefault(operation, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0
+        })
+        entry["calls"] += 1
+        if error:
+            entry["errors"] += 1
+            return
+        usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+            entry[field] += value or 0
+
+    def finish(self, sources_scanned: Optional[int], **details) -> Dict[str, Any]:
+        """AnalysisResult column values for this run"""
+        cpu = time.process_time() - self._cpu + _children_cpu_seconds() - self._children_cpu
+        return {
+            "pipeline_version": PIPELINE_VERSION,
+            "duration_seconds": round(time.perf_counter() - self._wall, 3),
+            "cpu_seconds": round(cpu, 3),
+            "peak_memory_mb": _peak_memory_mb(),
+            "sources_scanned": sources_scanned,
+            "run_stats": {
+                "stages": self.stages,
+                "openai": self.openai,
+                "extraction_cache_hit": self.extraction_cache_hit,
+                **details,
+            },
+        }
+
+
+# Recorder of the analysis running in this process; None in the API process
+_active: Optional[RunRecorder] = None
+
+
+def start_run() -> RunRecorder:
+    global _active
+    _active = RunRecorder()
+    return _active
+
+
+def record_openai(operation: str, response=None, error: bool = False):
+    """Attribute an OpenAI call to the running analysis, if any"""
+    if _active is not None:
+        _active.record_openai(operation, response, error)
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)], 3)
+
+
+def _summary(values: List[float]) -> Dict[str, Any]:
+    values = [value for value in values if value is not None]
+    return {
+        "avg": round(statistics.fmean(values), 3) if values else None,
+        "p50": _percentile(values, 0.5),
+        "p95": _percentile(values, 0.95),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+def _size_bucket(words: int) -> str:
+    for low, high in SIZE_BUCKETS:
+        if high is None or words < high:
+            return f"{low}+" if high is None else f"{low}-{high - 1}"
+    return "unknown"
+
+
+def _version_report(rows) -> Dict[str, Any]:
+    words = [row.word_count or 0 for row in rows]
+    durations = [row.duration_seconds for row in rows]
+    stages: Dict[str, List[float]] = {}
+    tokens = []
+    for row in rows:
+        run = row.run_stats or {}
+        for stage, timing in (run.get("stages") or {}).items():
+            stages.setdefault(stage, []).append(timing.get("wall_seconds"))
+        tokens.append(sum(entry.get("total_tokens", 0) for entry in (run.get("openai") or {}).values()))
+    by_size: Dict[str, List[float]] = {}
+    for count, duration in zip(words, durations):
+        by_size.setdefault(_size_bucket(count), []).append(duration)
+    total_words = sum(words)
+    return {
+        "analyses": len(rows),
+        "first_analyzed_at": min(row.analyzed_at for row in rows),
+        "last_analyzed_at": max(row.analyzed_at for row in rows),
+        "duration_seconds": _summary(durations),
+        "cpu_seconds": _summary([row.cpu_seconds for row in rows]),
+        "peak_memory_mb": _summary([row.peak_memory_mb for row in rows]),
+        "sources_scanned": _summary([row.sources_scanned for row in rows]),
+        "openai_tokens": _summary(tokens),
+        "stages": {stage: _summary(values) for stage, values in stages.items()},
+        # Latency against document size
+        "seconds_per_1k_words": round(1000 * sum(durations) / total_words, 3) if total_words else None,
+        "size_duration_correlation": (
+            round(statistics.correlation(words, durations), 3)
+            if len(rows) > 2 and len(set(words)) > 1 and len(set(durations)) > 1 else None
+        ),
+        "by_word_count": {bucket: _summary(values) for bucket, values in by_size.items()},
+    }
+
+
+async def performance_report(db: AsyncSession, since: Optional[datetime] = None,
+                             pipeline_version: Optional[str] = None) -> Dict[str, Any]:
+    """Aggregate recorded runs per pipeline version over the most recent analyses"""
+    query = (
+        select(
+            AnalysisResult.pipeline_version,
+            AnalysisResult.analyzed_at,
+            AnalysisResult.duration_seconds,
+            AnalysisResult.cpu_seconds,
+            AnalysisResult.peak_memory_mb,
+            AnalysisResult.sources_scanned,
+            AnalysisResult.run_stats,
+            Assignment.word_count
+        )
+        .join(Assignment, Assignment.id == AnalysisResult.assignment_id)
+        # Results cloned from a duplicate upload did not run the pipeline
+        .where(AnalysisResult.duration_seconds.isnot(None))
+        .order_by(AnalysisResult.analyzed_at.desc())
+        .limit(PERFORMANCE_REPORT_MAX_ROWS)
+    )
+    if since is not None:
+        query = query.where(AnalysisResult.analyzed_at >= since)
+    if pipeline_version is not None:
+        query = query.where(AnalysisResult.pipeline_version == pipeline_version)
+    rows = (await db.execute(query)).all()
+
+    versions: Dict[str, list] = {}
+    for row in rows:
+        versions.setdefault(row.pipeline_version or "unknown", []).append(row)
+    return {
+        "current_pipeline_version": PIPELINE_VERSION,
+        "analyses": len(rows),
+        "truncated": len(rows) == PERFORMANCE_REPORT_MAX_ROWS,
+        "versions": {version: _version_report(version_rows) for version, version_rows in versions.items()},
+    }
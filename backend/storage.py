@@ -0,0 +1,188 @@
+"""
+Streaming storage for uploaded assignment files
+"""
+
+import os
+import uuid
+import hashlib
+import asyncio
+import zipfile
+from dataclasses import dataclass
+from typing import List, Tuple, TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    # FastAPI is only needed by the API process, not by the analysis worker
+    from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Environment variables
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", "50")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+OBJECTS_DIR = os.path.join(UPLOAD_DIR, "objects")
+MAX_BATCH_UPLOAD_SIZE = int(os.getenv("MAX_BATCH_UPLOAD_SIZE_MB", "1024")) * 1024 * 1024
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+
+ALLOWED_EXTENSIONS = {"pdf", "docx"}
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured maximum size"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds maximum size of {limit} bytes")
+        self.limit = limit
+
+
+@dataclass
+class StoredUpload:
+    """Result of streaming an upload to disk"""
+    path: str
+    size: int
+    sha256: str
+
+
+async def stream_upload_to_disk(
+    upload: "UploadFile",
+    dest_path: str,
+    max_bytes: int = MAX_UPLOAD_SIZE,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> StoredUpload:
+    """Copy an upload to disk in fixed-size chunks, hashing as it goes.
+
+    Only one chunk is held in memory at a time. The data is written to a
+    ``.part`` file that is renamed into place once complete, so a rejected or
+    interrupted upload never leaves a truncated file at ``dest_path``.
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    partial_path = f"{dest_path}.part"
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(partial_path, "wb") as buffer:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                await asyncio.to_thread(buffer.write, chunk)
+        os.replace(partial_path, dest_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    logger.info(f"Stored upload {dest_path} ({size} bytes)")
+    return StoredUpload(path=dest_path, size=size, sha256=digest.hexdigest())
+
+
+def copy_stream_to_disk(
+    source,
+    dest_path: str,
+    max_bytes: int = MAX_UPLOAD_SIZE,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> StoredUpload:
+    """Synchronous counterpart of ``stream_upload_to_disk`` for file-like objects.
+
+    The size cap applies to the bytes actually read, so a zip member cannot
+    get past it by declaring a smaller size than it inflates to.
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    partial_path = f"{dest_path}.part"
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        with open(partial_path, "wb") as buffer:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                buffer.write(chunk)
+        os.replace(partial_path, dest_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    return StoredUpload(path=dest_path, size=size, sha256=digest.hexdigest())
+
+
+def extract_zip_members(zip_path: str, max_files: int = MAX_BATCH_FILES) -> List[Tuple[str, StoredUpload]]:
+    """Stream each supported member of a zip archive into a staging file.
+
+    Members are decompressed chunk by chunk straight to disk, so the archive is
+    never inflated in memory. Returns ``(member_filename, stored)`` pairs.
+    """
+    extracted = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in archive.infolist():
+                name = os.path.basename(member.filename)
+                extension = file_extension(name, default="")
+                if member.is_dir() or name.startswith('.') or extension not in ALLOWED_EXTENSIONS:
+                    continue
+                if len(extracted) >= max_files:
+                    raise ValueError(f"Archive contains more than {max_files} documents")
+
+                staging_path = os.path.join(UPLOAD_DIR, f"incoming-{uuid.uuid4().hex}.{extension}")
+                with archive.open(member) as source:
+                    extracted.append((name, copy_stream_to_disk(source, staging_path)))
+    except BaseException:
+        for _, stored in extracted:
+            if os.path.exists(stored.path):
+                os.remove(stored.path)
+        raise
+
+    return extracted
+
+
+def file_extension(filename: str, default: str = "pdf") -> str:
+    """Lower-case extension of an uploaded file name"""
+    return filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else default
+
+
+def content_path(sha256: str, extension: str) -> str:
+    """Content-addressed location for a file with the given digest"""
+    # Objects are always stored under a lower-case extension, whatever the upload was called
+    return os.path.join(OBJECTS_DIR, sha256[:2], f"{sha256}.{extension.lower()}")
+
+
+def store_content_addressed(stored: StoredUpload, extension: str) -> tuple:
+    """Move a staged upload into the content-addressed store.
+
+    Returns ``(path, is_duplicate)``. When identical bytes are already stored
+    the staged copy is discarded and the existing object is reused.
+    """
+    path = content_path(stored.sha256, extension)
+    if os.path.exists(path):
+        os.remove(stored.path)
+        return path, True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(stored.path, path)
+    return path, False
+
+
+def assignment_file_path(assignment) -> str:
+    """Locate the uploaded file for an assignment"""
+    extension = assignment.filename.split('.')[-1] if '.' in assignment.filename else 'pdf'
+    if assignment.file_hash:
+        path = content_path(assignment.file_hash, extension)
+        # Single uploads used to be stored under the extension's original case
+        legacy_path = os.path.join(OBJECTS_DIR, assignment.file_hash[:2], f"{assignment.file_hash}.{extension}")
+        if not os.path.exists(path) and os.path.exists(legacy_path):
+            return legacy_path
+        return path
+    # Uploads made before content addressing are stored under the assignment ID
+    return os.path.join(UPLOAD_DIR, f"{assignment.id}.{extension}")
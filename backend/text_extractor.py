@@ -3,31 +3,375 @@ Real-time text extraction from various file formats
 """
 
 import os
-import PyPDF2
-import docx
-from typing import Optional
+import re
+import mmap
+import time
+import multiprocessing
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Optional, List, Iterator, Iterable, Tuple, FrozenSet, TYPE_CHECKING
+from extraction_cache import file_sha256, get_cached_text, put_cached_text
 import logging
 
+# PDF/DOCX libraries are imported where used so that importing this module stays cheap
+if TYPE_CHECKING:
+    import PyPDF2
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
 logger = logging.getLogger(__name__)
 
+# Environment variables
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "120"))
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", "1024"))
+# PDFs at least this large are read lazily (memory-mapped, page objects released as they go)
+PDF_LAZY_THRESHOLD_MB = int(os.getenv("PDF_LAZY_THRESHOLD_MB", "20"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))  # 0 = no limit
+PDF_TEXT_BYTE_BUDGET = int(os.getenv("PDF_TEXT_BYTE_BUDGET_MB", "0")) * 1024 * 1024  # 0 = no limit
+
+_TOKEN = re.compile(r'\S+')
+
+
+class ExtractionError(Exception):
+    """Raised when a document cannot be extracted"""
+
+
+@dataclass
+class TextSegment:
+    """A page (PDF) or paragraph (DOCX) of raw extracted text"""
+    index: int
+    offset: int  # character offset of the segment in the raw document text
+    text: str
+    worker_cpu_seconds: float = 0.0  # parser CPU spent for this segment in an extraction pool worker
+
+
+@dataclass
+class ExtractedDocument:
+    """Cleaned text plus everything the pipeline stages need from it.
+
+    Built once by ``TextExtractor.build_document`` in a single pass over the
+    extracted segments and handed to every stage, so no stage has to re-split
+    or re-lowercase the text.
+    """
+    text: str
+    word_count: int
+    segment_count: int
+    tokens: List[str] = field(default_factory=list)  # lowercased whitespace-delimited tokens
+    token_offsets: List[int] = field(default_factory=list)  # start offset of each token in text
+    line_offsets: List[int] = field(default_factory=list)  # start offset of each line in text
+    from_cache: bool = False
+    parse_seconds: float = 0.0  # time spent waiting on the PDF/DOCX parser, the rest is cleaning
+    parse_cpu_seconds: float = 0.0  # CPU time of the parser, on the extracting thread or in pool workers
+    worker_cpu_seconds: float = 0.0  # the part of parse_cpu_seconds spent in pool workers
+    
+    @cached_property
+    def token_set(self) -> FrozenSet[str]:
+        """Distinct normalized tokens"""
+        return frozenset(self.tokens)
+    
+    def token_text(self, index: int) -> str:
+        """Original (non-normalized) text of a token"""
+        return _TOKEN.match(self.text, self.token_offsets[index]).group()
+    
+    def leading_words(self, count: int) -> str:
+        """The first ``count`` words of the document as written"""
+        return " ".join(self.token_text(i) for i in range(min(count, len(self.tokens))))
+
+
+def _limit_worker_memory(limit_mb: int):
+    """Pool initializer capping the address space of an extraction worker"""
+    if resource is not None and limit_mb > 0:
+        limit = limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _count_pdf_pages(file_path: str, lazy: bool = False) -> Tuple[int, float]:
+    """Number of pages, and the CPU time spent reading the page tree (runs in a pool worker)"""
+    import PyPDF2
+    started = time.process_time()
+    with open(file_path, 'rb') as file:
+        if lazy:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                page_count = len(PyPDF2.PdfReader(mapped).pages)
+        else:
+            page_count = len(PyPDF2.PdfReader(file).pages)
+    return page_count, time.process_time() - started
+
+
+def _extract_pages(pdf_reader: "PyPDF2.PdfReader", start: int, end: int, lazy: bool) -> List[str]:
+    texts = []
+    for page_num in range(start, end):
+        texts.append(pdf_reader.pages[page_num].extract_text())
+        if lazy:
+            # Drop the fonts, content streams and images resolved for this page
+            pdf_reader.resolved_objects.clear()
+    return texts
+
+
+def _extract_pdf_page_range(file_path: str, start: int, end: int, lazy: bool = False) -> List[str]:
+    """Extract the text of pages ``start``..``end - 1`` (runs in a pool worker).
+
+    In lazy mode the file is memory-mapped rather than buffered, and the
+    objects resolved for each page are released before the next one.
+    """
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        if lazy:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return _extract_pages(PyPDF2.PdfReader(mapped), start, end, lazy)
+        return _extract_pages(PyPDF2.PdfReader(file), start, end, lazy)
+
+
+def _extract_pdf_page_range_args(args: Tuple[str, int, int, bool]) -> Tuple[List[str], float]:
+    """Pool entry point; also returns the worker CPU time, which the parent cannot observe"""
+    started = time.process_time()
+    texts = _extract_pdf_page_range(*args)
+    return texts, time.process_time() - started
+
+
+def _new_pool(workers: int) -> "multiprocessing.pool.Pool":
+    return multiprocessing.Pool(
+        workers,
+        initializer=_limit_worker_memory,
+        initargs=(EXTRACTION_MEMORY_LIMIT_MB,)
+    )
+
+
+def _stop_pool(pool: "multiprocessing.pool.Pool"):
+    # terminate() also kills workers still stuck on a malformed document
+    pool.terminate()
+    pool.join()
+
+
+def _remaining(deadline: float) -> float:
+    return max(deadline - time.monotonic(), 0)
+
+
+def _iter_pdf_pages_pooled(pool: "multiprocessing.pool.Pool", ranges: List[Tuple[str, int, int, bool]],
+                           deadline: float) -> Iterator[Tuple[str, float]]:
+    """Extract page ranges in worker processes, yielding pages in order"""
+    results = pool.imap(_extract_pdf_page_range_args, ranges)
+    for _ in ranges:
+        texts, cpu_seconds = results.next(_remaining(deadline))
+        for position, text in enumerate(texts):
+            # A range's CPU time is attributed to its first page
+            yield text, cpu_seconds if position == 0 else 0.0
+
 class TextExtractor:
     """Extract text from various document formats"""
     
+    @staticmethod
+    def iter_pdf_pages(file_path: str, lazy: Optional[bool] = None,
+                       max_pages: int = PDF_MAX_PAGES,
+                       byte_budget: int = PDF_TEXT_BYTE_BUDGET) -> Iterator[TextSegment]:
+        """Yield the pages of a PDF file in order as they are extracted.
+
+        The pages are counted first. The document is split into page ranges
+        of ``PDF_PAGES_PER_TASK`` extracted by a pool of up to
+        ``PDF_EXTRACTION_WORKERS`` processes, one per range at most, and
+        earlier pages are yielded while later ones are still being extracted.
+        Short documents reuse the single worker that counted the pages, so
+        they only pay for one fork. Nothing is parsed in the calling process:
+        the whole document, page counting included, is bounded by
+        ``EXTRACTION_TIMEOUT_SECONDS`` and each worker by
+        ``EXTRACTION_MEMORY_LIMIT_MB``; on either limit the workers are
+        killed and ``ExtractionError`` is raised.
+
+        ``lazy`` (default: files of ``PDF_LAZY_THRESHOLD_MB`` or more) reads
+        the file through a memory map and releases page objects as it goes.
+        At most ``max_pages`` pages and ``byte_budget`` bytes of text are
+        yielded; 0 disables either limit.
+        """
+        if lazy is None:
+            lazy = os.path.getsize(file_path) >= PDF_LAZY_THRESHOLD_MB * 1024 * 1024
+        
+        deadline = time.monotonic() + EXTRACTION_TIMEOUT_SECONDS
+        pool = _new_pool(1)
+        try:
+            page_count, count_cpu_seconds = pool.apply_async(
+                _count_pdf_pages, (file_path, lazy)
+            ).get(_remaining(deadline))
+            if max_pages and page_count > max_pages:
+                logger.warning(f"Extracting only the first {max_pages} of {page_count} pages of {file_path}")
+                page_count = max_pages
+            ranges = [
+                (file_path, start, min(start + PDF_PAGES_PER_TASK, page_count), lazy)
+                for start in range(0, page_count, PDF_PAGES_PER_TASK)
+            ]
+            workers = max(min(PDF_EXTRACTION_WORKERS, len(ranges)), 1)
+            if workers > 1:
+                _stop_pool(pool)
+                pool = _new_pool(workers)
+            
+            index = offset = text_bytes = 0
+            for page_text, worker_cpu_seconds in _iter_pdf_pages_pooled(pool, ranges, deadline):
+                text_bytes += len(page_text.encode("utf-8"))
+                if byte_budget and text_bytes > byte_budget:
+                    logger.warning(f"Text byte budget of {byte_budget} reached after {index} pages of {file_path}")
+                    return
+                if index == 0:
+                    worker_cpu_seconds += count_cpu_seconds
+                yield TextSegment(index, offset, page_text, worker_cpu_seconds)
+                index += 1
+                offset += len(page_text) + 1
+        except multiprocessing.TimeoutError:
+            raise ExtractionError(f"Timed out after {EXTRACTION_TIMEOUT_SECONDS}s")
+        except MemoryError:
+            raise ExtractionError(f"Memory limit of {EXTRACTION_MEMORY_LIMIT_MB} MB exceeded")
+        finally:
+            # Also runs when the consumer abandons the document part-way
+            _stop_pool(pool)
+    
+    @staticmethod
+    def iter_docx_paragraphs(file_path: str) -> Iterator[TextSegment]:
+        """Yield the paragraphs of a Word document in order"""
+        import docx
+        doc = docx.Document(file_path)
+        offset = 0
+        for index, paragraph in enumerate(doc.paragraphs):
+            text = paragraph.text
+            yield TextSegment(index, offset, text)
+            offset += len(text) + 1
+    
+    @staticmethod
+    def iter_segments_from_file(file_path: str) -> Iterator[TextSegment]:
+        """Yield pages or paragraphs from a file based on its extension"""
+        if not os.path.exists(file_path):
+            raise ExtractionError(f"File not found: {file_path}")
+        
+        file_extension = os.path.splitext(file_path)[1].lower()
+        
+        if file_extension == '.pdf':
+            return TextExtractor.iter_pdf_pages(file_path)
+        elif file_extension in ['.docx', '.doc']:
+            return TextExtractor.iter_docx_paragraphs(file_path)
+        else:
+            raise ExtractionError(f"Unsupported file format: {file_extension}")
+    
+    @staticmethod
+    def iter_clean_lines(segments: Iterable[TextSegment]) -> Iterator[str]:
+        """Yield the stripped, non-empty lines of a segment stream"""
+        for segment in segments:
+            for line in segment.text.split('\n'):
+                cleaned_line = line.strip()
+                if cleaned_line:  # Only keep non-empty lines
+                    yield cleaned_line
+    
+    @staticmethod
+    def build_document(segments: Iterable[TextSegment]) -> ExtractedDocument:
+        """Clean and tokenize a segment stream in a single pass"""
+        lines = []
+        tokens = []
+        token_offsets = []
+        line_offsets = []
+        offset = 0
+        segment_count = 0
+        parse_seconds = 0.0
+        parse_cpu_seconds = 0.0
+        worker_cpu_seconds = 0.0
+        
+        def counted(stream):
+            # Time each pull separately so parsing and cleaning can be reported apart
+            nonlocal segment_count, parse_seconds, parse_cpu_seconds, worker_cpu_seconds
+            iterator = iter(stream)
+            while True:
+                started, started_cpu = time.perf_counter(), time.thread_time()
+                segment = next(iterator, None)
+                parse_seconds += time.perf_counter() - started
+                parse_cpu_seconds += time.thread_time() - started_cpu
+                if segment is None:
+                    return
+                # Pool workers parse in other processes, out of sight of thread_time()
+                worker_cpu_seconds += segment.worker_cpu_seconds
+                segment_count += 1
+                yield segment
+        
+        for line in TextExtractor.iter_clean_lines(counted(segments)):
+            if lines:
+                offset += 1
+            lines.append(line)
+            line_offsets.append(offset)
+            for match in _TOKEN.finditer(line):
+                token = match.group()
+                tokens.append(token.lower())
+                token_offsets.append(offset + match.start())
+            offset += len(line)
+        
+        return ExtractedDocument(
+            text='\n'.join(lines),
+            word_count=len(tokens),
+            segment_count=segment_count,
+            tokens=tokens,
+            token_offsets=token_offsets,
+            line_offsets=line_offsets,
+            parse_seconds=parse_seconds,
+            parse_cpu_seconds=parse_cpu_seconds + worker_cpu_seconds,
+            worker_cpu_seconds=worker_cpu_seconds
+        )
+    
+    @staticmethod
+    def document_from_text(text: str) -> ExtractedDocument:
+        """Build an ExtractedDocument from text that is already in memory"""
+        return TextExtractor.build_document([TextSegment(0, 0, text or "")])
+    
+    @staticmethod
+    def _cache_variant() -> str:
+        """Cache key suffix for the extraction limits in force; truncated text is only reused under the same limits"""
+        variant = ""
+        if PDF_MAX_PAGES:
+            variant += f".p{PDF_MAX_PAGES}"
+        if PDF_TEXT_BYTE_BUDGET:
+            variant += f".b{PDF_TEXT_BYTE_BUDGET}"
+        return variant
+    
+    @staticmethod
+    def _content_hash(file_path: str, file_hash: Optional[str]) -> Optional[str]:
+        if file_hash or not os.path.exists(file_path):
+            return file_hash
+        return file_sha256(file_path)
+    
+    @staticmethod
+    def extract_document(file_path: str, file_hash: Optional[str] = None) -> Optional[ExtractedDocument]:
+        """Stream a file through extraction and cleaning into an ExtractedDocument.
+
+        The cleaned text is cached by content hash, so re-processing the same
+        bytes skips PDF/DOCX parsing. Pass ``file_hash`` when it is already
+        known to avoid hashing the file again.
+        """
+        try:
+            file_hash = TextExtractor._content_hash(file_path, file_hash)
+            cached = get_cached_text(file_hash, TextExtractor._cache_variant())
+            if cached is not None:
+                document = TextExtractor.document_from_text(cached)
+                document.from_cache = True
+                logger.info(f"Using cached extraction of {file_path}")
+                return document
+            
+            document = TextExtractor.build_document(TextExtractor.iter_segments_from_file(file_path))
+            logger.info(f"Successfully extracted {len(document.text)} characters "
+                        f"from {document.segment_count} segments of {file_path}")
+            put_cached_text(file_hash, document.text, TextExtractor._cache_variant())
+            return document
+        except Exception as e:
+            logger.error(f"Error extracting text from {file_path}: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _join_segments(segments: Iterable[TextSegment]) -> str:
+        return "\n".join(segment.text for segment in segments).strip()
+    
     @staticmethod
     def extract_text_from_pdf(file_path: str) -> Optional[str]:
         """Extract text from PDF file"""
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text() + "\n"
-                
-                logger.info(f"Successfully extracted {len(text)} characters from PDF")
-                return text.strip()
-                
+            text = TextExtractor._join_segments(TextExtractor.iter_pdf_pages(file_path))
+            logger.info(f"Successfully extracted {len(text)} characters from PDF")
+            return text
         except Exception as e:
             logger.error(f"Error extracting text from PDF {file_path}: {str(e)}")
             return None
@@ -36,34 +380,33 @@ class TextExtractor:
     def extract_text_from_docx(file_path: str) -> Optional[str]:
         """Extract text from Word document"""
         try:
-            doc = docx.Document(file_path)
-            text = ""
-            
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            
+            text = TextExtractor._join_segments(TextExtractor.iter_docx_paragraphs(file_path))
             logger.info(f"Successfully extracted {len(text)} characters from DOCX")
-            return text.strip()
-            
+            return text
         except Exception as e:
             logger.error(f"Error extracting text from DOCX {file_path}: {str(e)}")
             return None
     
     @staticmethod
-    def extract_text_from_file(file_path: str) -> Optional[str]:
-        """Extract text from file based on extension"""
-        if not os.path.exists(file_path):
-            logger.error(f"File not found: {file_path}")
-            return None
-        
-        file_extension = os.path.splitext(file_path)[1].lower()
-        
-        if file_extension == '.pdf':
-            return TextExtractor.extract_text_from_pdf(file_path)
-        elif file_extension in ['.docx', '.doc']:
-            return TextExtractor.extract_text_from_docx(file_path)
-        else:
-            logger.error(f"Unsupported file format: {file_extension}")
+    def extract_text_from_file(file_path: str, file_hash: Optional[str] = None) -> Optional[str]:
+        """Extract cleaned text from file based on extension.
+
+        The text is cleaned as by ``clean_text`` whether it comes from the
+        cache or from parsing the file, so both paths return the same string.
+        """
+        try:
+            file_hash = TextExtractor._content_hash(file_path, file_hash)
+            cached = get_cached_text(file_hash, TextExtractor._cache_variant())
+            if cached is not None:
+                return cached
+            
+            text = TextExtractor.clean_text(
+                TextExtractor._join_segments(TextExtractor.iter_segments_from_file(file_path))
+            )
+            put_cached_text(file_hash, text, TextExtractor._cache_variant())
+            return text
+        except Exception as e:
+            logger.error(f"Error extracting text from {file_path}: {str(e)}")
             return None
     
     @staticmethod
@@ -78,14 +421,4 @@ class TextExtractor:
         """Clean and normalize extracted text"""
         if not text:
             return ""
-        
-        # Remove extra whitespace and normalize
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            cleaned_line = line.strip()
-            if cleaned_line:  # Only add non-empty lines
-                cleaned_lines.append(cleaned_line)
-        
-        return '\n'.join(cleaned_lines)
+        return '\n'.join(TextExtractor.iter_clean_lines([TextSegment(0, 0, text)]))
@@ -145,19 +145,31 @@ class AcademicHelperClient:
         print("="*60)
     
     def wait_for_analysis(self, assignment_id, max_wait=60):
-        """Wait for analysis to complete"""
+        """Wait for analysis to complete using the server-sent event stream"""
         print(f"⏳ Waiting for analysis to complete (max {max_wait}s)...")
         
+        headers = {"Authorization": f"Bearer {self.token}"}
         start_time = time.time()
-        while time.time() - start_time < max_wait:
-            result = self.get_analysis(assignment_id)
-            if result and result.get("status") != "processing":
-                return result
-            
-            print("⏳ Still processing...")
-            time.sleep(5)
-        
-        print("⏰ Timeout waiting for analysis")
+        try:
+            with requests.get(
+                f"{self.base_url}/analysis/{assignment_id}/events",
+                headers=headers, stream=True, timeout=max_wait
+            ) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        stage = line[len("event: "):]
+                        print(f"⏳ {stage}...")
+                        if stage in ("completed", "failed"):
+                            break
+                    if time.time() - start_time > max_wait:
+                        print("⏰ Timeout waiting for analysis")
+                        return None
+        except requests.exceptions.RequestException as e:
+            print(f"⏰ Event stream ended: {e}")
+        
+        result = self.get_analysis(assignment_id)
+        if result and result.get("status") != "processing":
+            return result
         return None
 
 def main():
@@ -163,16 +163,16 @@ def add_sample_data():
             }
         ]
         
-        for source in sample_sources:
-            insert_sql = """
-            INSERT INTO academic_sources (title, authors, publication_year, abstract, full_text, source_type)
-            VALUES (:title, :authors, :publication_year, :abstract, :full_text, :source_type)
-            ON CONFLICT DO NOTHING;
-            """
-            
-            with engine.connect() as conn:
-                conn.execute(text(insert_sql), source)
-                conn.commit()
+        insert_sql = """
+        INSERT INTO academic_sources (title, authors, publication_year, abstract, full_text, source_type)
+        VALUES (:title, :authors, :publication_year, :abstract, :full_text, :source_type)
+        ON CONFLICT DO NOTHING;
+        """
+        
+        # One connection and one transaction for the whole set; use
+        # scripts/load_sources.py for real catalogs
+        with engine.begin() as conn:
+            conn.execute(text(insert_sql), sample_sources)
         
         logger.info(f"Added {len(sample_sources)} sample academic sources")
         
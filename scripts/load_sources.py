@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Bulk loader for the academic source corpus
+Streams JSONL, CSV or JSON array input into academic_sources with COPY, generates
+embeddings in parallel batches and checkpoints progress so an interrupted load resumes.
+
+Usage:
+    python scripts/load_sources.py catalog.jsonl [--batch-size 5000] [--embed]
+"""
+
+import io
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import itertools
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Dict, Optional
+
+# Add the backend directory to the Python path
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+
+from models import engine
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("load_sources")
+
+COLUMNS = ("title", "authors", "publication_year", "abstract", "full_text", "source_type")
+REQUIRED_FIELDS = ("title", "authors", "source_type")
+
+# Keep embedding inputs well inside the model's token limit
+EMBED_MAX_CHARS = 20000
+
+# Progress lives in the database and is updated in the same transaction as each COPY,
+# so a resumed load never skips or duplicates a batch
+CHECKPOINT_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS source_load_checkpoints (
+    load_id VARCHAR PRIMARY KEY,
+    rows_done BIGINT NOT NULL DEFAULT 0,
+    rows_loaded BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+@dataclass
+class LoadStats:
+    consumed: int = 0
+    loaded: int = 0
+    skipped: int = 0
+    started: float = 0.0
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.loaded / elapsed if elapsed > 0 else 0.0
+
+def iter_records(path: Path) -> Iterator[Optional[dict]]:
+    """Yield raw input records one at a time; None marks an unparseable line"""
+    suffix = path.suffix.lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            yield from csv.DictReader(f)
+        elif suffix == ".json":
+            # Small JSON arrays such as data/sample_academic_sources.json
+            yield from json.load(f)
+        else:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"Skipping malformed line {line_number}: {e}")
+                    yield None
+
+def normalize_record(record: Optional[dict]) -> Optional[Dict]:
+    """Map an input record onto academic_sources columns, or None if it is unusable"""
+    if not isinstance(record, dict) or any(not record.get(field) for field in REQUIRED_FIELDS):
+        return None
+    row = {column: record.get(column) for column in COLUMNS}
+    if isinstance(row["authors"], list):
+        row["authors"] = ", ".join(row["authors"])
+    try:
+        year = row["publication_year"]
+        row["publication_year"] = int(year) if year not in (None, "") else None
+    except (TypeError, ValueError):
+        row["publication_year"] = None
+    return row
+
+def read_batches(path: Path, skip: int, batch_size: int) -> Iterator[List[Optional[dict]]]:
+    records = iter_records(path)
+    # Fast-forward past records committed by an earlier run
+    for _ in itertools.islice(records, skip):
+        pass
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def has_embedding_column(raw_connection) -> bool:
+    cursor = raw_connection.cursor()
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'academic_sources' AND column_name = 'embedding'"
+    )
+    return cursor.fetchone() is not None
+
+def copy_batch(raw_connection, load_id: str, rows: List[Dict], embeddings: Optional[List[List[float]]], rows_done: int):
+    """COPY one batch and advance the checkpoint in a single transaction"""
+    columns = list(COLUMNS) + (["embedding"] if embeddings is not None else [])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for i, row in enumerate(rows):
+        # Unquoted empty fields load as NULL
+        values = ["" if row[column] is None else row[column] for column in COLUMNS]
+        if embeddings is not None:
+            values.append(json.dumps(embeddings[i], separators=(",", ":")))
+        writer.writerow(values)
+    buffer.seek(0)
+
+    cursor = raw_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY academic_sources ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute(
+            """
+            INSERT INTO source_load_checkpoints (load_id, rows_done, rows_loaded)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (load_id) DO UPDATE SET
+                rows_done = EXCLUDED.rows_done,
+                rows_loaded = source_load_checkpoints.rows_loaded + EXCLUDED.rows_loaded,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (load_id, rows_done, len(rows))
+        )
+        raw_connection.commit()
+    except Exception:
+        raw_connection.rollback()
+        raise
+
+async def embed_rows(rag_service, rows: List[Dict], batch_size: int, semaphore: asyncio.Semaphore) -> List[List[float]]:
+    """Embed a batch of rows with up to `semaphore` OpenAI requests in flight"""
+    texts = [
+        (row["full_text"] or row["abstract"] or row["title"])[:EMBED_MAX_CHARS]
+        for row in rows
+    ]
+
+    async def embed_chunk(chunk: List[str]) -> List[List[float]]:
+        async with semaphore:
+            return await rag_service.generate_embeddings(chunk)
+
+    results = await asyncio.gather(*(
+        embed_chunk(texts[start:start + batch_size])
+        for start in range(0, len(texts), batch_size)
+    ))
+    return [embedding for chunk in results for embedding in chunk]
+
+async def load_corpus(
+    path: Path,
+    load_id: Optional[str] = None,
+    batch_size: int = 5000,
+    embed: bool = False,
+    embed_batch_size: int = 100,
+    embed_concurrency: int = 4,
+    restart: bool = False
+) -> LoadStats:
+    """Load a source catalog into academic_sources, resuming from the last checkpoint"""
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("The bulk loader requires PostgreSQL (COPY)")
+    load_id = load_id or path.name
+
+    raw_connection = engine.raw_connection()
+    try:
+        cursor = raw_connection.cursor()
+        cursor.execute(CHECKPOINT_TABLE_SQL)
+        if restart:
+            cursor.execute("DELETE FROM source_load_checkpoints WHERE load_id = %s", (load_id,))
+        cursor.execute("SELECT rows_done FROM source_load_checkpoints WHERE load_id = %s", (load_id,))
+        checkpoint = cursor.fetchone()
+        raw_connection.commit()
+
+        stats = LoadStats(consumed=checkpoint[0] if checkpoint else 0, started=time.monotonic())
+        if stats.consumed:
+            logger.info(f"Resuming load '{load_id}' after {stats.consumed} input records")
+
+        rag_service = None
+        if embed:
+            if not has_embedding_column(raw_connection):
+                logger.warning("academic_sources has no embedding column; loading without embeddings")
+            else:
+                from rag_service import RAGService
+                rag_service = RAGService()
+                if not rag_service.openai_api_key:
+                    logger.warning("OPENAI_API_KEY not set; loading without embeddings")
+                    rag_service = None
+        semaphore = asyncio.Semaphore(embed_concurrency)
+
+        async def commit_batch(rows, embeddings, rows_done):
+            await asyncio.to_thread(copy_batch, raw_connection, load_id, rows, embeddings, rows_done)
+            stats.loaded += len(rows)
+            logger.info(
+                f"Committed {stats.loaded} rows ({rows_done} input records, "
+                f"{stats.skipped} skipped) at {stats.rate():.0f} rows/sec"
+            )
+
+        pending = None
+        for batch in read_batches(path, stats.consumed, batch_size):
+            rows = [row for row in map(normalize_record, batch) if row]
+            stats.skipped += len(batch) - len(rows)
+            # Embed this batch while the previous one is still being copied
+            embeddings = await embed_rows(rag_service, rows, embed_batch_size, semaphore) if rag_service and rows else None
+            if pending:
+                await pending
+            stats.consumed += len(batch)
+            pending = asyncio.create_task(commit_batch(rows, embeddings, stats.consumed))
+        if pending:
+            await pending
+
+        logger.info(
+            f"Load '{load_id}' finished: {stats.loaded} rows in "
+            f"{time.monotonic() - stats.started:.1f}s ({stats.rate():.0f} rows/sec), "
+            f"{stats.skipped} skipped"
+        )
+        return stats
+    finally:
+        raw_connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load academic sources from JSONL, CSV or JSON")
+    parser.add_argument("input", type=Path, help="Catalog file (.jsonl, .csv or .json)")
+    parser.add_argument("--load-id", help="Checkpoint key (defaults to the input file name)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per COPY transaction")
+    parser.add_argument("--embed", action="store_true", help="Generate embeddings while loading")
+    parser.add_argument("--embed-batch-size", type=int, default=100, help="Texts per embedding request")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--restart", action="store_true", help="Ignore any saved checkpoint")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(load_corpus(
+            args.input,
+            load_id=args.load_id,
+            batch_size=args.batch_size,
+            embed=args.embed,
+            embed_batch_size=args.embed_batch_size,
+            embed_concurrency=args.embed_concurrency,
+            restart=args.restart
+        ))
+    except Exception as e:
+        logger.error(f"Bulk load failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
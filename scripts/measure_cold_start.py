@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Measure cold start of the API and the analysis worker
+Each sample is a fresh interpreter importing the module, which is what an
+autoscaled API replica or a per-job analysis subprocess pays before doing work.
+
+Usage:
+    python scripts/measure_cold_start.py [--runs 5] [--modules process_assignment main]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+BACKEND_DIR = ROOT_DIR / "backend"
+
+def time_import(module: str) -> float:
+    """Wall time of `python -c 'import <module>'` in a fresh process"""
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR)}
+    started = time.perf_counter()
+    # main mounts web_interface/ relative to the working directory
+    subprocess.run(
+        [sys.executable, "-c", f"import {module}"],
+        cwd=ROOT_DIR, env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure interpreter start + import time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=["process_assignment", "main"])
+    args = parser.parse_args()
+
+    baseline = [time_import("sys") for _ in range(args.runs)]
+    print(f"{'interpreter':<20} median {statistics.median(baseline):.3f}s")
+    for module in args.modules:
+        samples = [time_import(module) for _ in range(args.runs)]
+        print(f"{module:<20} median {statistics.median(samples):.3f}s  min {min(samples):.3f}s  max {max(samples):.3f}s")
+    print("Run `python -X importtime -c 'import <module>'` in backend/ for a per-module breakdown.")
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,9 @@ This script tests the main API endpoints to ensure they're working correctly.
 import requests
 import json
 import time
+import io
 import os
+import zipfile
 from pathlib import Path
 
 # Configuration
@@ -121,6 +123,85 @@ def test_analysis_retrieval(token, assignment_id):
         print(f"Analysis retrieval error: {str(e)}")
         return False
 
+def make_text_pdf(text):
+    """Build a one-page PDF whose text PyPDF2 can extract"""
+    stream = f"BT /F1 12 Tf 20 100 Td ({text}) Tj ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [4 0 R] /Count 1 >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 200] /Resources << /Font << /F1 3 0 R >> >> /Contents 5 0 R >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+    ]
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+def wait_for_analysis(token, assignment_id, timeout=60):
+    """Poll an analysis until it leaves the processing state"""
+    headers = {"Authorization": f"Bearer {token}"}
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        data = requests.get(f"{BASE_URL}/analysis/{assignment_id}", headers=headers).json()
+        if data.get("status") != "processing":
+            return data
+        time.sleep(1)
+    return None
+
+def test_batch_upload_uppercase_extension(token):
+    """Test that batch members with upper-case extensions are analyzed from their real text"""
+    print("Testing batch upload with upper-case extensions...")
+    try:
+        headers = {"Authorization": f"Bearer {token}"}
+        # Unique words so the uploads are not served from an earlier identical submission
+        words = f"Uppercase extension check {int(time.time())}"
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("two.PDF", make_text_pdf(words + " zipped"))
+        files = [
+            ("files", ("batch.zip", archive.getvalue(), "application/zip")),
+            ("files", ("ONE.Pdf", make_text_pdf(words + " loose"), "application/pdf")),
+        ]
+        response = requests.post(f"{BASE_URL}/upload/batch", headers=headers, files=files)
+        if response.status_code != 200:
+            print(f"Batch upload failed: {response.status_code} - {response.text}")
+            return False
+        for assignment_id in response.json()["assignment_ids"]:
+            data = wait_for_analysis(token, assignment_id)
+            # The extraction-failure fallback text is far longer than the five words uploaded
+            if not data or data.get("word_count") != 5:
+                print(f"Assignment {assignment_id} was not analyzed from its text: {data}")
+                return False
+        print("Batch upload with upper-case extensions passed")
+        return True
+    except Exception as e:
+        print(f"Batch upload error: {str(e)}")
+        return False
+
+def test_profile_token_non_ascii():
+    """Test that a non-ASCII profiling token is rejected instead of failing the request"""
+    print("Testing non-ASCII profiling token...")
+    try:
+        headers = {"X-Profile-Token": "é".encode("latin-1")}
+        health = requests.get(f"{BASE_URL}/health", headers=headers)
+        profiles = requests.get(f"{BASE_URL}/profiles", headers=headers)
+        # 404 when PROFILE_ADMIN_TOKEN is not configured, 403 when it is
+        if health.status_code == 200 and profiles.status_code in (403, 404):
+            print("Non-ASCII profiling token passed")
+            return True
+        print(f"Non-ASCII profiling token failed: /health {health.status_code}, /profiles {profiles.status_code}")
+        return False
+    except Exception as e:
+        print(f"Non-ASCII profiling token error: {str(e)}")
+        return False
+
 def main():
     """Run all tests"""
     print("Starting API Tests for Academic Assignment Helper")
@@ -152,6 +233,15 @@ def main():
         # Test 5: Analysis Retrieval
         test_analysis_retrieval(token, assignment_id)
     
+    print()
+    
+    # Test 6: Batch upload with upper-case extensions
+    test_batch_upload_uppercase_extension(token)
+    print()
+    
+    # Test 7: Profiling token with non-ASCII characters
+    test_profile_token_non_ascii()
+    
     print()
     print("=" * 60)
     print("API testing completed!")
@@ -5,5 +5,10 @@ echo "Starting Academic Assignment Helper API..."
 echo "Port: ${PORT:-8000}"
 echo "Database URL: ${DATABASE_URL}"
 
+# Apply schema migrations before serving (no-op when already at head)
+if [ "${RUN_MIGRATIONS:-true}" = "true" ]; then
+    alembic upgrade head || exit 1
+fi
+
 # Run the application
 exec uvicorn main:app --host 0.0.0.0 --port ${PORT:-8000}
\ No newline at end of file